@@ -0,0 +1,86 @@
+# benchmarks/chart_formats.py
+"""比較各圖種在不同輸出格式下的繪製時間與檔案大小。
+
+用法：
+    python benchmarks/chart_formats.py                  # 預設 365 天的折線圖
+    python benchmarks/chart_formats.py --days 1825 --repeat 5 --json out.json
+
+每個 (圖種, 格式) 組合重複繪製 --repeat 次，回報中位數時間與輸出位元組數。
+直接呼叫繪圖函式，不經過圖表快取與 process pool。
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import statistics
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import matplotlib
+matplotlib.use("Agg")
+import numpy as np
+import pandas as pd
+
+from src.charts import ChartSpec, render_chart
+
+# (標籤, 格式, dpi)
+VARIANTS = [
+    ("png@100", "png", 100),
+    ("png@150", "png", 150),
+    ("png@300", "png", 300),
+    ("svg", "svg", 150),
+    ("svg-simplified", "svg-simplified", 150),
+]
+
+def sample_specs(days: int, slices: int, seed: int = 0) -> dict:
+    rng = np.random.default_rng(seed)
+    pie = pd.DataFrame({
+        "label": [f"Item {i}" for i in range(slices)],
+        "total": np.sort(rng.integers(1_000, 100_000, size=slices))[::-1],
+    })
+    daily = pd.DataFrame({
+        "sale_date": pd.date_range(end=pd.Timestamp.today().normalize(), periods=days),
+        "total": rng.normal(450_000, 60_000, size=days).cumsum() / np.arange(1, days + 1),
+    })
+    return {
+        "pie": ChartSpec("pie", pie, {"label_col": "label", "title": "Benchmark"}),
+        "line": ChartSpec("line", daily),
+    }
+
+def bench(spec: ChartSpec, fmt: str, dpi: int, repeat: int) -> dict:
+    params = {**spec.params, "fmt": fmt, "dpi": dpi}
+    times, size = [], 0
+    for _ in range(repeat):
+        start = time.perf_counter()
+        img = render_chart(ChartSpec(spec.kind, spec.data, params))
+        times.append(time.perf_counter() - start)
+        size = len(img)
+    return {"median_ms": round(statistics.median(times) * 1000, 2), "bytes": size}
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--days", type=int, default=365, help="Length of the daily series for the line chart")
+    parser.add_argument("--slices", type=int, default=6, help="Number of pie slices")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--json", help="Also write the results to this JSON file")
+    args = parser.parse_args(argv)
+
+    specs = sample_specs(args.days, args.slices)
+    render_chart(specs["pie"])  # 暖機：字型快取等一次性成本不計入
+
+    results = []
+    print(f"{'chart':<6} {'format':<16} {'median ms':>10} {'bytes':>10}")
+    for kind, spec in specs.items():
+        for label, fmt, dpi in VARIANTS:
+            r = {"chart": kind, "format": label, **bench(spec, fmt, dpi, args.repeat)}
+            results.append(r)
+            print(f"{kind:<6} {label:<16} {r['median_ms']:>10.2f} {r['bytes']:>10,}")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"days": args.days, "slices": args.slices, "repeat": args.repeat,
+                       "results": results}, f, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,271 @@
+# benchmarks/pipeline.py
+"""整條報表流程的分段效能量測，附可調規模的測試資料產生器。
+
+用法：
+    python benchmarks/pipeline.py                                   # 預設 100 萬筆
+    python benchmarks/pipeline.py --rows 5000000 --clients 20000 --products 500 --days 1825 --skew 1.1
+    python benchmarks/pipeline.py --json results/abc123.json        # 存成 JSON
+    python benchmarks/pipeline.py --json new.json --compare old.json  # 與另一次結果比較
+
+產生的資料與 create_test_file.py 同欄位；--skew 為客戶 / 產品熱門程度的 Zipf 指數（0 為均勻）。
+--data-dir 指定資料夾時資料會保留，下次相同參數直接沿用。
+
+每個階段各跑 --repeat 次取中位數；另外在 tracemalloc 下再跑一次，記錄該階段的記憶體峰值
+（tracemalloc 會拖慢執行，因此不與計時混在一起）。圖表直接呼叫繪圖函式，不經快取與 process pool；
+PDF 預設使用 fake 後端，只量測 HTML 的讀取與寫出。
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import tempfile
+import statistics
+import subprocess
+import tracemalloc
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, ROOT)
+
+import matplotlib
+matplotlib.use("Agg")
+import numpy as np
+import pandas as pd
+
+from src.ingest import parse_csv, read_table
+from src.aggregate import SalesTotals, enrich_sales, update_totals
+from src.charts import CHART_FORMATS, data_uri, mime_type, render_chart
+from src.template import Raw, compile_template
+from src.pdf import BACKENDS, make_converter
+from src.task import TEMPLATE_MD, chart_specs, report_tables, summary_fields
+
+# ---------------- 測試資料 ----------------
+
+def _weights(n: int, skew: float) -> np.ndarray:
+    w = 1.0 / np.arange(1, n + 1) ** skew
+    return w / w.sum()
+
+def generate(rows: int, clients: int, products: int, days: int, skew: float = 0.0,
+             sale_ids: int = 24, seed: int = 0) -> dict:
+    """回傳 {"sales", "sales_info", "client"} 三張表；sales 依日期排序（與實際的附加寫入相同）。"""
+    rng = np.random.default_rng(seed)
+    client_ids = np.arange(1001, 1001 + clients)
+    codes = np.array([f"P{i:05d}" for i in range(products)])
+
+    start = pd.Timestamp.today().normalize() - pd.Timedelta(days=days - 1)
+    seconds = np.sort(rng.integers(0, days * 86400, size=rows))
+    sales = pd.DataFrame({
+        "sale_id": pd.Series(rng.integers(1, sale_ids + 1, size=rows)).astype(str).str.zfill(4),
+        "client_id": rng.choice(client_ids, size=rows, p=_weights(clients, skew)),
+        "sale_date": start + pd.to_timedelta(seconds, unit="s"),
+        "amount": rng.integers(1000, 8000, size=rows),
+        "product_code": rng.choice(codes, size=rows, p=_weights(products, skew)),
+    })
+    sales_info = pd.DataFrame({
+        "product_code": codes,
+        "product_name": [f"Product {i}" for i in range(products)],
+        "category": rng.choice(["Widget", "Gadget", "Gizmo"], size=products),
+        "price": rng.integers(100, 2000, size=products),
+    })
+    client = pd.DataFrame({
+        "client_id": client_ids,
+        "client_name": [f"Client {i}" for i in range(clients)],
+        "region": rng.choice(["North", "East", "South", "West"], size=clients),
+    })
+    return {"sales": sales, "sales_info": sales_info, "client": client}
+
+def write_dataset(tables: dict, data_dir: str) -> dict:
+    os.makedirs(data_dir, exist_ok=True)
+    paths = {}
+    for name, df in tables.items():
+        paths[name] = os.path.join(data_dir, f"{name}.csv")
+        df.to_csv(paths[name], index=False)
+    return paths
+
+def prepare_dataset(args, data_dir: str) -> tuple:
+    """產生（或沿用）資料集，回傳 (路徑, 產生所花秒數)。"""
+    params = {k: getattr(args, k) for k in ("rows", "clients", "products", "days", "skew", "seed")}
+    marker = os.path.join(data_dir, "params.json")
+    paths = {name: os.path.join(data_dir, f"{name}.csv") for name in ("sales", "sales_info", "client")}
+    if os.path.isfile(marker) and all(os.path.isfile(p) for p in paths.values()):
+        with open(marker, "r", encoding="utf-8") as f:
+            if json.load(f) == params:
+                return paths, 0.0
+
+    start = time.perf_counter()
+    paths = write_dataset(generate(**params), data_dir)
+    with open(marker, "w", encoding="utf-8") as f:
+        json.dump(params, f)
+    return paths, time.perf_counter() - start
+
+# ---------------- 量測 ----------------
+
+def measure(fn, repeat: int, setup=None) -> tuple:
+    """fn 跑 repeat 次取時間，再於 tracemalloc 下跑一次取記憶體峰值；回傳 (統計, 最後一次結果)。"""
+    times = []
+    for _ in range(repeat):
+        if setup:
+            setup()
+        start = time.perf_counter()
+        result = fn()
+        times.append(time.perf_counter() - start)
+
+    if setup:
+        setup()
+    tracemalloc.start()
+    fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    stats = {
+        "median_ms": round(statistics.median(times) * 1000, 2),
+        "min_ms": round(min(times) * 1000, 2),
+        "peak_kib": round(peak / 1024, 1),
+    }
+    return stats, result
+
+def run_stages(paths: dict, work_dir: str, repeat: int, pdf_backend: str) -> dict:
+    stages = {}
+
+    def stage(name, fn, setup=None):
+        stats, result = measure(fn, repeat, setup)
+        stages[name] = stats
+        print(f"{name:<24} {stats['median_ms']:>10.2f} {stats['min_ms']:>10.2f} {stats['peak_kib']:>12,.0f}")
+        return result
+
+    print(f"{'stage':<24} {'median ms':>10} {'min ms':>10} {'peak KiB':>12}")
+
+    # 讀檔：直接解析 CSV，以及欄式快取的冷 / 熱讀取
+    sales = stage("csv_load.sales", lambda: parse_csv(paths["sales"], "sales"))
+    sales_info = stage("csv_load.sales_info", lambda: parse_csv(paths["sales_info"], "sales_info"))
+    client = stage("csv_load.client", lambda: parse_csv(paths["client"], "client"))
+
+    ingest_dir = os.path.join(work_dir, "ingest")
+    stage("ingest_cache.cold", lambda: read_table(paths["sales"], cache_dir=ingest_dir),
+          setup=lambda: shutil.rmtree(ingest_dir, ignore_errors=True))
+    stage("ingest_cache.warm", lambda: read_table(paths["sales"], cache_dir=ingest_dir))
+
+    # 合併與彙總
+    enriched = stage("join", lambda: enrich_sales(sales, sales_info, client))
+    totals = stage("groupby", lambda: SalesTotals.from_enriched(enriched))
+
+    agg_dir = os.path.join(work_dir, "aggregates")
+    stage("update_totals.full", lambda: update_totals(paths["sales"], sales_info, store_dir=agg_dir, rebuild=True))
+    stage("update_totals.noop", lambda: update_totals(paths["sales"], sales_info, store_dir=agg_dir))
+
+    tables = stage("report_tables", lambda: report_tables(totals, sales_info, client))
+
+    # 每張圖各自計時
+    specs = chart_specs(tables, totals, CHART_FORMATS)
+    images = {}
+    for key, spec in specs.items():
+        images[key] = stage(f"chart.{key}", lambda spec=spec: render_chart(spec))
+
+    # 模板：markdown 編譯、HTML 寫出、PDF
+    with open(TEMPLATE_MD, "r", encoding="utf-8") as f:
+        md_text = f.read()
+    tpl = stage("template.markdown", lambda: compile_template(md_text))
+
+    mapping = {**{k: Raw(data_uri(img, mime_type(specs[k].params["fmt"]))) for k, img in images.items()},
+               **summary_fields(tables)}
+    out_html = os.path.join(work_dir, "report.html")
+    out_pdf = os.path.join(work_dir, "report.pdf")
+    stage("template.html_write", lambda: tpl.write(mapping, out_html))
+
+    with make_converter(pdf_backend) as conv:
+        stage(f"pdf.{conv.name}", lambda: conv.convert(out_html, out_pdf))
+
+    return stages
+
+def _tiny_inputs():
+    """暖機用的極小資料。"""
+    t = generate(rows=50, clients=3, products=3, days=5)
+    totals = SalesTotals.from_enriched(enrich_sales(t["sales"], t["sales_info"], t["client"]))
+    return report_tables(totals, t["sales_info"], t["client"]), totals
+
+def _git_commit():
+    try:
+        out = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True)
+        return out.stdout.strip() or None
+    except OSError:
+        return None
+
+def _max_rss_kib():
+    try:
+        import resource  # Windows 沒有
+    except ImportError:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss // 1024 if sys.platform == "darwin" else rss  # macOS 單位為 bytes
+
+def compare(new: dict, old: dict):
+    """逐階段列出中位數時間與記憶體峰值的變化。"""
+    print(f"\nvs {old.get('commit') or '?'} ({old.get('timestamp', '?')})")
+    print(f"{'stage':<24} {'old ms':>10} {'new ms':>10} {'ratio':>7} {'old KiB':>12} {'new KiB':>12}")
+    for name, s in new["stages"].items():
+        o = old["stages"].get(name)
+        if o is None:
+            print(f"{name:<24} {'-':>10} {s['median_ms']:>10.2f}")
+            continue
+        ratio = s["median_ms"] / o["median_ms"] if o["median_ms"] else float("inf")
+        print(f"{name:<24} {o['median_ms']:>10.2f} {s['median_ms']:>10.2f} {ratio:>6.2f}x "
+              f"{o['peak_kib']:>12,.0f} {s['peak_kib']:>12,.0f}")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--clients", type=int, default=5_000)
+    parser.add_argument("--products", type=int, default=200)
+    parser.add_argument("--days", type=int, default=730, help="Date span of the sales data")
+    parser.add_argument("--skew", type=float, default=1.0, help="Zipf exponent for client/product popularity (0 = uniform)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--pdf-backend", choices=BACKENDS, default="fake")
+    parser.add_argument("--data-dir", help="Keep the generated dataset here and reuse it on later runs")
+    parser.add_argument("--json", help="Write the results to this JSON file")
+    parser.add_argument("--compare", help="Compare against a previous JSON result")
+    args = parser.parse_args(argv)
+
+    work_dir = tempfile.mkdtemp(prefix="ras-bench-")
+    try:
+        paths, gen_s = prepare_dataset(args, args.data_dir or os.path.join(work_dir, "data"))
+        print(f"dataset: {args.rows:,} rows, {args.clients:,} clients, {args.products:,} products, "
+              f"{args.days} days, skew {args.skew} ({os.path.getsize(paths['sales']) / 2**20:.1f} MiB"
+              + (f", generated in {gen_s:.1f}s)" if gen_s else ", reused)"))
+        # 暖機：字型快取與 markdown 擴充套件載入等一次性成本不計入
+        render_chart(chart_specs(*_tiny_inputs(), CHART_FORMATS)["img_client"])
+        compile_template("warm-up")
+
+        stages = run_stages(paths, work_dir, args.repeat, args.pdf_backend)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    result = {
+        "commit": _git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "pandas": pd.__version__,
+        "numpy": np.__version__,
+        "matplotlib": matplotlib.__version__,
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "params": {k: getattr(args, k) for k in ("rows", "clients", "products", "days", "skew", "seed",
+                                                 "repeat", "pdf_backend")},
+        "stages": stages,
+        "stages_sum_ms": round(sum(s["median_ms"] for s in stages.values()), 2),
+        "max_rss_kib": _max_rss_kib(),
+    }
+    print(f"{'sum of stages':<24} {result['stages_sum_ms']:>10.2f}"
+          + (f"   max RSS {result['max_rss_kib'] / 1024:,.0f} MiB" if result["max_rss_kib"] else ""))
+
+    if args.json:
+        os.makedirs(os.path.dirname(os.path.abspath(args.json)), exist_ok=True)
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(result, f, indent=2)
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            compare(result, json.load(f))
+
+if __name__ == "__main__":
+    main()
@@ -1,16 +1,113 @@
 import os, sys, json, signal, ctypes
 from PySide6.QtWidgets import (QApplication, QMainWindow, QLabel, QPushButton, 
-                               QVBoxLayout, QHBoxLayout, QWidget, QTextEdit, QDialog, QListWidget,
+                               QVBoxLayout, QHBoxLayout, QWidget, QDialog, QListWidget,
                                QSystemTrayIcon, QMenu, QFileDialog, QDateTimeEdit, QComboBox, QDialogButtonBox, QListWidgetItem, QCheckBox, QTimeEdit, QRadioButton)
-from PySide6.QtCore import Qt, QEvent, QDateTime, QTime, QDate, QTimer, QProcess
+from PySide6.QtCore import Qt, QEvent, QDateTime, QTime, QDate, QTimer, QProcess, QObject, Signal
 from PySide6.QtGui import QFont, QIcon
 from pathlib import Path
 from src.remove import MonitoredFilePicker
+from src.watcher import FileWatcher
+from src.scheduler import Scheduler
+from src.jobs import JobQueue, DONE
+from src.report_sets import resolve_report_sets, input_paths, sets_for_paths, chart_workers_per_process
+from src.spans import format_breakdown
+from src.logview import LogView, DEFAULT_MAX_BYTES, DEFAULT_BACKUPS
+from src.config import ConfigStore
 from datetime import datetime
 
 WEEKDAYS = ["一","二","三","四","五","六","日"]  # 1..7
 
+MAX_ARM_MS = 5 * 60 * 1000  # 排程 timer 最長等待時間，之後依實際時間重新計算
+DEFAULT_CONCURRENT_JOBS = max(2, min(4, os.cpu_count() or 1))  # 同時執行的報表工作數（= 常駐 worker 數），可由 config 的 max_concurrent_jobs 覆寫
+JOB_VIEW_ROWS = 50              # 工作清單顯示的最近筆數
+DEFAULT_LOG_FILE = str(Path(__file__).resolve().parent / "logs" / "gui.log")  # 操作紀錄的磁碟檔，可由 config 的 log_file 覆寫
+CONFIG_SAVE_DELAY_MS = 1000     # 設定變更後延遲寫檔，連續的變更合併成一次寫入
+
+class ReportWorker(QObject):
+    """一個常駐的 python -m src.worker 行程，一次處理一筆工作，意外結束時由 GUI 重新啟動。"""
+    message = Signal(dict)           # worker 回傳的 JSON 訊息
+    output = Signal(str)             # 非協定輸出與 stderr
+    crashed = Signal(object, str)    # (執行中的 job id 或 None, 結束資訊)
+
+    def __init__(self, root, chart_workers=None, parent=None):
+        super().__init__(parent)
+        self.root = root
+        self.chart_workers = chart_workers
+        self.proc = None
+        self.ready = False
+        self.current_job = None
+        self._buf = b""
+        self._stopping = False
+
+    @property
+    def idle(self) -> bool:
+        return self.ready and self.current_job is None
+
+    def start(self):
+        self._buf = b""
+        self.ready = False
+        self.current_job = None
+
+        proc = QProcess(self)
+        proc.setProgram(sys.executable)
+        args = ["-m", "src.worker"]
+        if self.chart_workers:
+            args += ["--chart-workers", str(self.chart_workers)]
+        proc.setArguments(args)
+        proc.setWorkingDirectory(str(self.root))
+        proc.readyReadStandardOutput.connect(self._on_stdout)
+        proc.readyReadStandardError.connect(
+            lambda: self.output.emit(bytes(proc.readAllStandardError()).decode("utf-8", errors="ignore").rstrip())
+        )
+        proc.finished.connect(self._on_finished)
+        proc.errorOccurred.connect(
+            lambda err: err == QProcess.FailedToStart and self.output.emit(f"❌ Worker 無法啟動: {proc.errorString()}")
+        )
+        self.proc = proc
+        proc.start()
+
+    def stop(self):
+        if not self.proc:
+            return
+        self._stopping = True
+        self.proc.closeWriteChannel()  # stdin EOF -> worker 正常結束
+        if not self.proc.waitForFinished(3000):
+            self.proc.kill()
+
+    def send(self, job: dict):
+        self.current_job = job["id"]
+        self.proc.write((json.dumps(job, ensure_ascii=False) + "\n").encode("utf-8"))
+
+    def _on_stdout(self):
+        self._buf += bytes(self.proc.readAllStandardOutput())
+        *lines, self._buf = self._buf.split(b"\n")
+        for raw in lines:
+            text = raw.decode("utf-8", errors="ignore").rstrip()
+            if not text:
+                continue
+            try:
+                msg = json.loads(text)
+            except json.JSONDecodeError:
+                self.output.emit(text)  # 非協定輸出（例如外部程式訊息）照原樣顯示
+                continue
+            if msg.get("event") == "ready":
+                self.ready = True
+            elif msg.get("id") == self.current_job:
+                self.current_job = None
+            self.message.emit(msg)
+
+    def _on_finished(self, exitCode, exitStatus):
+        if self._stopping:
+            return
+        job_id, self.current_job, self.ready = self.current_job, None, False
+        self.proc.deleteLater()
+        self.proc = None
+        self.crashed.emit(job_id, f"code={exitCode}, status={exitStatus}")
+
 class ReportAutomationGUI(QMainWindow):
+    # 監看 thread 發出，Qt 會以 queued connection 轉回主執行緒處理
+    files_changed = Signal(list)
+
     def __init__(self):
         super().__init__()
 
@@ -34,22 +131,45 @@ class ReportAutomationGUI(QMainWindow):
         self.setup_tray()
 
         self.scheduler_on = False
-        self.scheduler_timer = None
-        self._fired_keys = set()   # 防止同分鐘重複觸發
+        self.scheduler = None
+        self.schedule_fired = {}  # 見 src/scheduler.py 的 Scheduler.fired
+        self.scheduler_timer = QTimer(self)
+        self.scheduler_timer.setSingleShot(True)
+        self.scheduler_timer.setTimerType(Qt.PreciseTimer)
+        self.scheduler_timer.timeout.connect(self._on_schedule_timer)
+
+        # 檔案監看（背景 thread，不佔用 Qt 事件迴圈）
+        self.watcher = None
+        self.files_changed.connect(self._on_files_changed)
 
         self.monitored_set = set()
         # self.schedules = {}
         
         self.config_path = 'config/config.json'
-        self.config = {
-            'monitored_files'      : [],
-            'schedules'            : {},  
-        }
+        self.store = ConfigStore(self.config_path)  # 驗證過的設定；有變更才寫檔（原子寫入）
+        self.config = self.store.config
+        self.config_save_timer = QTimer(self)
+        self.config_save_timer.setSingleShot(True)
+        self.config_save_timer.setInterval(CONFIG_SAVE_DELAY_MS)
+        self.config_save_timer.timeout.connect(self._flush_config)
         
-        self.proc = None
+        # 常駐 worker：只啟動一次，之後透過 stdin 送工作；工作由佇列依序分派
+        self.workers = []
+        self.jobs = None
 
         self.read_config()
-        self.schedules = self.config.get("schedules", [])
+        self.schedules = self.config.schedules
+        self.result_text.configure(max_lines=self.config.log_max_lines,
+                                   path=self.config.log_file or DEFAULT_LOG_FILE,
+                                   max_bytes=self.config.log_max_bytes or DEFAULT_MAX_BYTES,
+                                   backups=self.config.log_backups or DEFAULT_BACKUPS)
+
+        self.jobs = JobQueue(max_concurrent=self.config.max_concurrent_jobs or DEFAULT_CONCURRENT_JOBS)
+        self._start_workers(self.jobs.max_concurrent)
+        QApplication.instance().aboutToQuit.connect(self._stop_workers)
+        QApplication.instance().aboutToQuit.connect(self._stop_watcher)
+        QApplication.instance().aboutToQuit.connect(self._flush_config)
+        QApplication.instance().aboutToQuit.connect(self.result_text.shutdown)
 
     def setup_tray(self):
         if not QSystemTrayIcon.isSystemTrayAvailable():
@@ -152,6 +272,11 @@ class ReportAutomationGUI(QMainWindow):
         self.btn3.setStyleSheet("QPushButton {background-color: #6554C0; color: white; font-size: 14px; padding: 10px; border-radius: 5px;}")
         button_layout.addWidget(self.btn3)
 
+        self.btn6 = QPushButton("On Watching")
+        self.btn6.clicked.connect(self.on_watching)
+        self.btn6.setStyleSheet("QPushButton {background-color: #00B8D9; color: white; font-size: 14px; padding: 10px; border-radius: 5px;}")
+        button_layout.addWidget(self.btn6)
+
         layout.addLayout(button_layout)
 
         # Monitered Files List
@@ -169,28 +294,36 @@ class ReportAutomationGUI(QMainWindow):
         result_label.setFont(QFont("Arial", 12, QFont.Bold))
         layout.addWidget(result_label)
         
-        self.result_text = QTextEdit()
-        self.result_text.setMaximumHeight(200)
+        # 有上限、批次更新的紀錄區（append 與 QTextEdit 相容），完整紀錄輪替寫到 logs/gui.log
+        self.result_text = LogView()
+        self.result_text.setMaximumHeight(230)
         self.result_text.setPlaceholderText("Operation results will appear here...")
         self.result_text.setFont(QFont("Consolas", 10))
         layout.addWidget(self.result_text)
 
-    def write_config(self):
-        self.config['monitored_files'] = sorted(self.monitored_set)
-
-        def sort_key(s):
-            if s.get('mode') == 'once':
-                return (0, s.get('datetime', ''))
-            return (1, tuple(sorted(s.get('weekdays', []))), s.get('time', ''))
+        # Job Queue
+        jobs_label = QLabel("Jobs:")
+        jobs_label.setFont(QFont("Arial", 12, QFont.Bold))
+        layout.addWidget(jobs_label)
 
-        self.config['schedules'] = sorted(self.schedules, key=sort_key)
+        self.job_list_widget = QListWidget()
+        self.job_list_widget.setFont(QFont("Consolas", 10))
+        self.job_list_widget.setMaximumHeight(120)
+        layout.addWidget(self.job_list_widget)
 
+    def write_config(self):
+        """標記設定已變更；最後一次變更後 CONFIG_SAVE_DELAY_MS 才實際寫檔（schedules 已在修改時排序）。"""
+        self.config.monitored_files = sorted(self.monitored_set)
+        self.config.schedules = self.schedules
+        self.store.mark_dirty()
+        self.config_save_timer.start()  # 重新計時：連續變更只寫一次
+
+    def _flush_config(self):
+        self.config_save_timer.stop()
         try:
-            os.makedirs(os.path.dirname(self.config_path), exist_ok=True)
-            with open(self.config_path, "w", encoding="utf-8") as f:
-                json.dump(self.config, f, ensure_ascii=False, indent=4)
-            self.result_text.append(f"💾 已儲存設定到 {self.config_path}")
-        except Exception as e:
+            if self.store.flush():
+                self.result_text.append(f"💾 已儲存設定到 {self.config_path}")
+        except OSError as e:
             self.result_text.append(f"❌ 儲存設定失敗: {e}")
 
     # 原始
@@ -219,30 +352,27 @@ class ReportAutomationGUI(QMainWindow):
         """讀取設定檔並載入 monitored_files"""
 
         if not os.path.exists(self.config_path):
-            # 若沒有設定檔就初始化一個空的 config
+            # 若沒有設定檔就使用預設值（第一次變更時才建立檔案）
             self.result_text.append("📄 不存在已知設定檔。")
             return
 
         try:
-            with open(self.config_path, "r", encoding="utf-8") as f:
-                self.config = json.load(f)
+            self.config = self.store.load()  # 經過型別與內容驗證
 
             # 載入監控清單
-            files = self.config.get("monitored_files", [])
-            self.monitored_set = set(files)
-
-            self.schedules = self.config.get("schedules", {})
+            self.monitored_set = set(self.config.monitored_files)
+            self.schedules = self.config.schedules
             
-            self.result_text.append(f"📂 已載入設定，共 {len(files)} 個監控檔案。")
+            self.result_text.append(f"📂 已載入設定，共 {len(self.monitored_set)} 個監控檔案。")
             self.result_text.append(f"📅 已載入，共 {len(self.schedules)}個排程時刻。")
             # 若 UI 有清單區塊則同步刷新
             if hasattr(self, "update_monitored_view"):
                 self.update_monitored_view()
 
-        except Exception as e:
-            self.config = {"monitored_files": []}
+        except (OSError, ValueError) as e:
+            self.config = self.store.config
             self.monitored_set = set()
-            self.result_text.append(f"⚠️ 讀取設定失敗: {e}")
+            self.result_text.append(f"⚠️ 讀取設定失敗: {e}（修改設定時會先把原檔備份為 .bad）")
 
     # Refresh the monitored files list
     def update_monitored_view(self):
@@ -250,9 +380,10 @@ class ReportAutomationGUI(QMainWindow):
         self.monitored_list_widget.clear()
         for f in sorted(self.monitored_set):
             self.monitored_list_widget.addItem(f)
-        
-        # 寫入state.json
-        self.write_config()
+
+        # 只刷新畫面；監控清單真的改變時由呼叫端 write_config()
+        if self.watcher:
+            self.watcher.update_paths(self._watch_paths())
         
         self.status_label.setText(f"✅ {len(self.monitored_set)} files monitored")
     
@@ -263,9 +394,9 @@ class ReportAutomationGUI(QMainWindow):
 
         files, _ = QFileDialog.getOpenFileNames(
             self, 
-            "選擇多個Excel檔案", 
+            "選擇多個資料檔案（CSV / Excel）", 
             "C:/Users/ADMIN/Desktop",  # 預設Desktop
-            "Excel Files (*.xlsx *.xls);;All Files (*)"
+            "Data Files (*.csv *.xlsx *.xlsm *.xls);;CSV Files (*.csv);;Excel Files (*.xlsx *.xlsm *.xls);;All Files (*)"
         )
         
         if files:  # files是LIST！
@@ -281,11 +412,12 @@ class ReportAutomationGUI(QMainWindow):
                 else:
                     self.monitored_set.add(f)
                     status = "Selected."
-                # i 佔 3 位右對齊，f 限 50 字符（多則截斷）
-                msgs.append(f"{i:03}: {f:<100} | {status}")
+                msgs.append(f"{i:03}: {f} | {status}")
 
             # 一次性寫入訊息，避免多次重繪
             self.result_text.append("\n".join(msgs))
+            if any(msg.endswith("Selected.") for msg in msgs):
+                self.write_config()
             self.update_monitored_view()
 
         else:
@@ -321,10 +453,12 @@ class ReportAutomationGUI(QMainWindow):
                 status = "Removed."
             else:
                 status = "Not in monitored list."
-            msgs.append(f"{i:03}: {f:<100} | {status}")
+            msgs.append(f"{i:03}: {f} | {status}")
 
         self.result_text.append("\n".join(msgs))
         self.status_label.setText(f"✅ {len(self.monitored_set)} files monitored | {removed} removed")
+        if removed:
+            self.write_config()
         self.update_monitored_view()
     
     # Scheduling 
@@ -366,6 +500,7 @@ class ReportAutomationGUI(QMainWindow):
         self.schedules = result
 
         self.write_config()
+        self._rebuild_scheduler()
             
     def setting_report_time(self):
 
@@ -532,100 +667,112 @@ class ReportAutomationGUI(QMainWindow):
         
    
     def once_now(self):
-        if not self.monitored_set:
+        if not self.monitored_set and not self.config.report_sets:
             self.result_text.append("ℹ️ 無監聽檔案可執行。")
             return
-        self.status_label.setText("Running task on monitored files...")
-        start = datetime.now()
-        succeeded, failed = 0, 0
-
-        for f in sorted(self.monitored_set):
-            try:
-                self._run_task()  # 實際任務
-                self.result_text.append(f"✅ Done: {f}")
-                succeeded += 1
-            except Exception as e:
-                self.result_text.append(f"❌ Failed: {f} | {e}")
-                failed += 1
-
-        secs = (datetime.now() - start).total_seconds()
-        self.status_label.setText(f"Done. {succeeded} ok, {failed} fail.")
-        self.result_text.append(f"⏱ 完成。耗時 {secs:.1f}s")
-
-    def _run_task(self):
-        # 如果已在跑，就不重複啟動
-        if self.proc and self.proc.state() != QProcess.NotRunning:
-            self.result_text.append("ℹ️ Task is still running…")
+        # 每個報表組各一筆工作，不再逐檔重複送出
+        try:
+            self._run_task()
+        except Exception as e:
+            self.result_text.append(f"❌ Failed: {e}")
+            self.status_label.setText("Task failed.")
+
+    # Worker pool
+    def _start_workers(self, count):
+        root = Path(__file__).resolve().parent
+        chart_workers = chart_workers_per_process(count)
+        for _ in range(count):
+            w = ReportWorker(root, chart_workers, self)
+            w.message.connect(lambda msg, w=w: self._on_worker_message(w, msg))
+            w.output.connect(lambda text, w=w: self.result_text.append(text, job=w.current_job))
+            w.crashed.connect(lambda job_id, info, w=w: self._on_worker_crashed(w, job_id, info))
+            self.workers.append(w)
+            w.start()
+
+    def _stop_workers(self):
+        for w in self.workers:
+            w.stop()
+
+    def _on_worker_message(self, worker, msg):
+        if msg.get("event") == "ready":
+            self.result_text.append(f"🟢 Worker ready (pid={msg.get('pid')})")
+            self._dispatch_jobs()
             return
 
-        base = Path(__file__).resolve().parent            # .../src
-        task_py = str(base / "src/task.py")                   # src/task.py
-        python_exe = sys.executable                       # 目前 venv 的 Python
+        job = self.jobs.finish(msg.get("id"), msg.get("status") == "ok", result=msg, error=msg.get("error"))
+        if job is not None:
+            if job.state == DONE and msg.get("cached"):
+                self.result_text.append(f"♻️ Cached: job #{job.id} -> {msg.get('output')} "
+                                        f"(inputs unchanged, {msg.get('elapsed', 0):.2f}s)", job=job.id)
+            elif job.state == DONE:
+                self.result_text.append(f"✅ Done: job #{job.id} -> {msg.get('output')} ({msg.get('elapsed', 0):.2f}s)",
+                                        job=job.id)
+            else:
+                self.result_text.append(f"❌ Failed: job #{job.id} | {job.error} ({msg.get('elapsed', 0):.2f}s)",
+                                        job=job.id)
+            if msg.get("spans"):
+                self.result_text.append(f"   ⏱ {format_breakdown(msg['spans'])}", job=job.id)
+            if msg.get("profile"):
+                self.result_text.append(f"   🔬 Profile: {msg['profile']['profile']}", job=job.id)
+        self._dispatch_jobs()
+
+    def _on_worker_crashed(self, worker, job_id, info):
+        self.result_text.append(f"⚠️ Worker 結束 ({info})，1 秒後重新啟動。")
+        if job_id is not None:
+            self.jobs.finish(job_id, False, error="worker crashed")
+            self.result_text.append(f"❌ Failed: job #{job_id} | worker crashed", job=job_id)
+        self._refresh_job_view()
+        QTimer.singleShot(1000, worker.start)
+
+    def _dispatch_jobs(self):
+        """把排隊中的工作交給閒置的 worker，直到達到同時執行上限。"""
+        for w in self.workers:
+            if not w.idle:
+                continue
+            job = self.jobs.next_ready()
+            if job is None:
+                break
+            self.result_text.append(f"▶ Running job #{job.id}: {job.label}", job=job.id, label=job.label)
+            w.send({"id": job.id, **job.payload})
+        self._refresh_job_view()
+
+    def _refresh_job_view(self):
+        self.job_list_widget.clear()
+        for job in self.jobs.jobs()[:JOB_VIEW_ROWS]:
+            self.job_list_widget.addItem(job.describe())
+        running, pending = self.jobs.running_count(), self.jobs.pending_count()
+        if running or pending:
+            self.status_label.setText(f"Running {running} job(s), {pending} queued")
+        else:
+            self.status_label.setText("Ready - Choose Action")
 
-        self.result_text.append(f"▶ Running: {python_exe} {task_py}")
-        self.status_label.setText("Running task...")
-        
-        # -------------------------
-        sales_path = None
-        sales_info_path = None
-        client_path = None
-
-        for p in self.monitored_set:
-            name = Path(p).name.lower()
-            if name == "sales.csv":
-                sales_path = p
-            elif name == "sales_info.csv":
-                sales_info_path = p
-            elif name == "client.csv":
-                client_path = p
-        print(sales_path)
-        print(sales_info_path)
-        print(client_path)
-
-        # 檢查是否三個都找到
-        missing = []
-        if sales_path is None:
-            missing.append("sales.csv")
-        if sales_info_path is None:
-            missing.append("sales_info.csv")
-        if client_path is None:
-            missing.append("client.csv")
-
-        if missing:
-            raise FileNotFoundError(f"❌ 以下檔案未在 monitored_set 中找到: {', '.join(missing)}")
-        
-        # -------------------------
-        self.proc = QProcess(self)
-        self.proc.setProgram(python_exe)
-        self.proc.setArguments([
-            task_py,
-            "--sales", sales_path,
-            "--sales-info", sales_info_path,
-            "--client", client_path,
-        ])
-        # -------------------------
-
-        # 可選：設定工作目錄；task.py 內已用 __file__ 取路徑，這行可有可無
-        self.proc.setWorkingDirectory(str(base))
-
-        # 抓兩路輸出
-        self.proc.readyReadStandardOutput.connect(
-            lambda: self.result_text.append(
-                bytes(self.proc.readAllStandardOutput()).decode("utf-8", errors="ignore").rstrip()
-            )
-        )
-        self.proc.readyReadStandardError.connect(
-            lambda: self.result_text.append(
-                bytes(self.proc.readAllStandardError()).decode("utf-8", errors="ignore").rstrip()
-            )
-        )
+    def _run_task(self, paths=None):
+        """每個報表組送出一筆工作；paths 有值時只處理輸入檔有變動的組。
+
+        config 沒有 report_sets 時，依檔名在 monitored_set 中找出 sales.csv / sales_info.csv / client.csv。
+        """
+        sets = resolve_report_sets(self.config.to_dict(), self.monitored_set)
+        if paths is not None:
+            sets = sets_for_paths(sets, paths)
+
+        # 選用：各階段計時寫入檔案、慢報表剖析（config 的 span_log / profile_slow_s）
+        extra = {k: getattr(self.config, k) for k in ("span_log", "profile_slow_s")
+                 if getattr(self.config, k) is not None}
+        for rs in sets:
+            payload = {**extra, **{k: v for k, v in rs.items() if k != "name"}}
+            job, created = self.jobs.submit(json.dumps(payload, sort_keys=True), payload, label=rs["name"])
+            if created:
+                self.result_text.append(f"▶ Queued job #{job.id} ({rs['name']})", job=job.id, label=rs["name"])
+            else:
+                self.result_text.append(f"ℹ️ 相同的工作 #{job.id} ({rs['name']}) 已在排隊，合併處理。", job=job.id)
+        self._dispatch_jobs()
 
-        def _done(exitCode, exitStatus):
-            self.status_label.setText(f"Task finished. code={exitCode}")
-            self.result_text.append(f"✅ Done. ExitCode={exitCode}, Status={exitStatus}")
-        
-        self.proc.finished.connect(_done)
-        self.proc.start()
+    def _watch_paths(self):
+        """監控檔案加上各報表組的輸入檔。"""
+        try:
+            return sorted(self.monitored_set | set(input_paths(resolve_report_sets(self.config.to_dict(), self.monitored_set))))
+        except (FileNotFoundError, ValueError):
+            return sorted(self.monitored_set)
     
     def on_scheduling(self):
         if not self.scheduler_on:
@@ -633,75 +780,91 @@ class ReportAutomationGUI(QMainWindow):
                 self.result_text.append("ℹ️ 尚無排程。請先在 Setting Report Time 設定。")
                 return
             # 啟動
-            self.scheduler_timer = self.scheduler_timer or QTimer(self)
-            self.scheduler_timer.timeout.connect(self._check_due_schedules)
-            self.scheduler_timer.start(15_000)  # 每 15 秒檢查一次
             self.scheduler_on = True
+            self._rebuild_scheduler()
             self.btn3.setText("Off Scheduling")
             self.status_label.setText("Scheduling ON")
             self.result_text.append("🟢 排程已啟動。")
         else:
             # 停止
-            if self.scheduler_timer:
-                self.scheduler_timer.stop()
+            self.scheduler_timer.stop()
+            self.scheduler = None
             self.scheduler_on = False
             self.btn3.setText("On Scheduling")
             self.status_label.setText("Scheduling OFF")
             self.result_text.append("🔴 排程已關閉。")
 
-    def _check_due_schedules(self):
-        now = QDateTime.currentDateTime()
-        now_min = now.toString("yyyy-MM-dd HH:mm")
-
-        # 清除前一分鐘的 fired key
-        self._fired_keys = {k for k in self._fired_keys if k.startswith(now_min)}
-
-        due = False
-        remaining = []
-        for s in self.schedules:
-            if s.get("mode") == "weekly":
-                wds = s.get("weekdays", [])
-                tstr = s.get("time")  # "HH:mm"
-                if not isinstance(wds, list) or not tstr:
-                    remaining.append(s)
-                    continue
-
-                if now.date().dayOfWeek() in wds and now.time().toString("HH:mm") == tstr:
-                    key = f"{now_min}|weekly|{tuple(sorted(wds))}|{tstr}"
-                    if key not in self._fired_keys:
-                        self._fired_keys.add(key)
-                        due = True
-                remaining.append(s)  # weekly 不移除
-
-            else:  # once
-                dts = s.get("datetime")  # "yyyy-MM-dd HH:mm"
-                if not dts:
-                    # 異常資料，跳過但保留
-                    remaining.append(s)
-                    continue
-                dt = QDateTime.fromString(dts, "yyyy-MM-dd HH:mm")
-                if not dt.isValid():
-                    remaining.append(s)
-                    continue
-
-                if now >= dt:
-                    key = f"{now_min}|once|{dts}"
-                    if key not in self._fired_keys:
-                        self._fired_keys.add(key)
-                        due = True
-                    # once 觸發後不回存，達成自動移除
-                else:
-                    remaining.append(s)
-
-        if due:
-            self.result_text.append(f"⏰ 觸發排程：{now.toString('yyyy-MM-dd HH:mm:ss')}")
+    def _rebuild_scheduler(self):
+        """排程清單變更時重建 heap，並重新設定下一次觸發。"""
+        if not self.scheduler_on:
+            return
+        # 共用已觸發的紀錄：剛觸發的排程不會因同一分鐘內的編輯或開關排程而再觸發
+        self.scheduler = Scheduler(self.schedules, catch_up=self.config.catch_up, fired=self.schedule_fired)
+        self._arm_scheduler()
+
+    def _arm_scheduler(self):
+        """只設定一個 single-shot timer，在下一個排程時刻醒來。"""
+        nxt = self.scheduler.next_fire_time()
+        if nxt is None:
+            self.scheduler_timer.stop()
+            self.result_text.append("ℹ️ 沒有即將到來的排程。")
+            return
+        ms = max(0, int((nxt - datetime.now()).total_seconds() * 1000))
+        # QTimer 以單調時鐘計時，睡眠或調整系統時間後會失準；最多等 MAX_ARM_MS 就依實際時間重新計算
+        self.scheduler_timer.start(min(ms, MAX_ARM_MS))
+
+    def _on_schedule_timer(self):
+        now = datetime.now()
+        fires = self.scheduler.pop_due(now)
+
+        ran = [f for f in fires if not f.skipped]
+        for f in fires:
+            if f.skipped:
+                self.result_text.append(f"⏭ 略過錯過的排程：{f.at:%Y-%m-%d %H:%M}")
+            elif f.missed:
+                self.result_text.append(f"⏪ 補跑錯過的排程：{f.at:%Y-%m-%d %H:%M}")
+
+        if ran:
+            self.result_text.append(f"⏰ 觸發排程：{now:%Y-%m-%d %H:%M:%S}")
             self.once_now()
 
-        # 若有變更（例如移除已執行的 once）則回存
-        if len(remaining) != len(self.schedules):
-            self.schedules = remaining
+        # once 觸發（或略過）後自動移除並回存
+        done = {id(f.schedule) for f in fires if f.schedule.get("mode") == "once"}
+        if done:
+            self.schedules = [s for s in self.schedules if id(s) not in done]
             self.write_config()
 
+        self._arm_scheduler()
+
+    # Watching
+    def on_watching(self):
+        if not (self.watcher and self.watcher.running):
+            paths = self._watch_paths()
+            if not paths:
+                self.result_text.append("ℹ️ 無監聽檔案可監看。")
+                return
+            self.watcher = FileWatcher(paths, self.files_changed.emit)
+            self.watcher.start()
+            self.btn6.setText("Off Watching")
+            self.status_label.setText("Watching ON")
+            self.result_text.append("👀 檔案監看已啟動，檔案寫入完成後會自動產生報表。")
+        else:
+            self._stop_watcher()
+            self.btn6.setText("On Watching")
+            self.status_label.setText("Watching OFF")
+            self.result_text.append("🔴 檔案監看已關閉。")
+
+    def _stop_watcher(self):
+        if self.watcher:
+            self.watcher.stop()
+            self.watcher = None
+
+    def _on_files_changed(self, paths):
+        self.result_text.append(f"👀 偵測到 {len(paths)} 個檔案變動：" + ", ".join(Path(p).name for p in paths))
+        try:
+            self._run_task(paths)  # 只處理輸入有變動的報表組；彙總為增量，只解析新增資料
+        except Exception as e:
+            self.result_text.append(f"❌ Failed: {e}")
 
     # RUN ALL NOW : 按下去不管時程，跑全部的報表。
     def generate_report(self):
@@ -0,0 +1,10 @@
+# ras/__init__.py
+"""無視窗的報表自動化入口，適合在沒有顯示環境的伺服器上執行：
+
+    python -m ras run                 # 立即產生所有報表組後結束
+    python -m ras schedule            # 依 config 的排程常駐執行
+    python -m ras watch               # 監看輸入檔，寫入完成後產生報表
+
+讀取與 GUI 相同的 config/config.json，重用 src.scheduler、src.watcher、src.jobs 與
+src.report_sets，完全不匯入 Qt；pandas / matplotlib 只在產生報表的子行程中載入。
+"""
@@ -0,0 +1,4 @@
+# ras/__main__.py
+from ras.cli import main
+
+main()
@@ -0,0 +1,327 @@
+# ras/cli.py
+"""python -m ras run|schedule|watch
+
+run       產生報表組後結束；有失敗時 exit code 為 1。
+schedule  依 config 的 schedules 常駐，只在下一個排程時刻醒來（與 GUI 相同的 heap 排程）。
+watch     監看報表組的輸入檔，寫入完成後只重建輸入有變動的組；加上 --schedule 可同時排程。
+backfill  為每組產生日期範圍內每個期間（日 / 週 / 月 / 季 / 年）的報表（見 src/backfill.py）。
+
+常駐模式以單一事件佇列處理排程、檔案變動與工作完成：工作經 JobQueue 合併與排隊，
+交給常駐的 process pool 執行，參考表在 pool 行程中跨工作保留。config.json 變更時
+（例如在 GUI 修改排程）會在下次醒來時重新載入。SIGINT / SIGTERM 會等執行中的報表完成後結束。
+"""
+import os
+import sys
+import json
+import queue
+import signal
+import logging
+import threading
+import argparse
+from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from ras.log import setup, log
+from src.jobs import JobQueue, DONE
+from src.scheduler import Scheduler
+from src.pdf import BACKENDS
+from src.config import load_config, save_config
+from src.spans import recording
+from src.report_sets import (OPTIONS, CONFIG_PATH, chart_workers_per_process, init_process, input_paths,
+                             read_config, resolve_report_sets, run_one, run_report_sets, sets_for_paths)
+
+MAX_SLEEP_S = 300                # 與 GUI 相同：最長睡眠時間，之後依實際時間重新計算（電腦睡眠、調整時鐘）
+STOP_POLL_S = 0.5                # 檢查停止訊號的間隔
+DEFAULT_CONCURRENT_JOBS = max(2, min(4, os.cpu_count() or 1))
+
+def _config_mtime(path: str):
+    try:
+        return os.stat(path).st_mtime_ns
+    except OSError:
+        return None
+
+def _select(sets, names):
+    if not names:
+        return sets
+    unknown = set(names) - {rs["name"] for rs in sets}
+    if unknown:
+        raise ValueError(f"Unknown report set(s): {', '.join(sorted(unknown))}")
+    return [rs for rs in sets if rs["name"] in names]
+
+def _remove_once(path: str, consumed: list):
+    """把已觸發的 once 排程從 config 移除（重新讀檔，只動 schedules，原子寫入）。"""
+    config = load_config(path)
+    config.schedules = [s for s in config.schedules if s not in consumed]
+    save_config(path, config)
+
+class Runner:
+    """以 JobQueue 合併、排隊報表工作，交給常駐的 process pool；完成結果送回事件佇列。"""
+
+    def __init__(self, max_workers: int, events: queue.Queue, options: dict = None):
+        self.max_workers = max_workers
+        self.events = events
+        self.options = options or {}
+        self.jobs = JobQueue(max_concurrent=max_workers)
+        self._pool = None
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(max_workers=self.max_workers, initializer=init_process,
+                                             initargs=(chart_workers_per_process(self.max_workers),))
+        return self._pool
+
+    def submit(self, sets, reason: str):
+        for rs in sets:
+            payload = {**self.options, **{k: v for k, v in rs.items() if k != "name"}}
+            job, created = self.jobs.submit(json.dumps(payload, sort_keys=True), payload, label=rs["name"])
+            log("job.queued" if created else "job.coalesced", job=job.id, set=rs["name"], reason=reason)
+        self.dispatch()
+
+    def dispatch(self):
+        while (job := self.jobs.next_ready()) is not None:
+            log("job.started", job=job.id, set=job.label, wait_s=round(job.wait_s, 3))
+            fut = self._get_pool().submit(run_one, {"id": job.id, **job.payload})
+            fut.add_done_callback(lambda f, job_id=job.id: self.events.put(("done", job_id, f)))
+
+    def on_done(self, job_id: int, fut):
+        try:
+            res = fut.result()
+        except BrokenProcessPool as e:
+            # 子行程意外結束：丟棄整個 pool，下一筆工作重新建立
+            res = {"id": job_id, "status": "error", "error": f"worker crashed: {e}"}
+            if self._pool is not None:
+                self._pool.shutdown(wait=False, cancel_futures=True)
+                self._pool = None
+        except Exception as e:
+            res = {"id": job_id, "status": "error", "error": f"{type(e).__name__}: {e}"}
+
+        job = self.jobs.finish(job_id, res.get("status") == "ok", result=res, error=res.get("error"))
+        if job is not None:
+            if job.state == DONE:
+                log("job.done", job=job.id, set=job.label, output=res.get("output"), cached=res.get("cached", False),
+                    elapsed=res.get("elapsed"), wait_s=round(job.wait_s, 3), spans=res.get("spans"))
+            else:
+                log("job.failed", logging.ERROR, job=job.id, set=job.label, error=job.error,
+                    elapsed=res.get("elapsed"), spans=res.get("spans"))
+        self.dispatch()
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=True, cancel_futures=True)
+            self._pool = None
+
+class Daemon:
+    def __init__(self, args, schedule: bool, watch: bool):
+        self.args = args
+        self.config_path = args.config
+        self.use_schedule = schedule
+        self.use_watch = watch
+        self.events = queue.Queue()
+        self.config = {}
+        self.config_mtime = None
+        self.sets = []
+        self.scheduler = None
+        self.watcher = None
+        self.runner = None
+        self.stop_signal = None          # 收到的 SIGINT / SIGTERM
+        self._stopping = threading.Event()
+
+    def load_config(self):
+        self.config = read_config(self.config_path)
+        self.config_mtime = _config_mtime(self.config_path)
+        self.sets = _select(resolve_report_sets(self.config, self.config.get("monitored_files", [])),
+                            self.args.names)
+
+        if self.use_schedule:
+            # 重新載入時沿用已觸發的紀錄，剛觸發的排程不會在同一分鐘內再觸發
+            self.scheduler = Scheduler(self.config.get("schedules", []),
+                                       catch_up=self.config.get("catch_up", "once"),
+                                       fired=self.scheduler.fired if self.scheduler else None)
+        if self.use_watch:
+            paths = input_paths(self.sets)
+            if self.watcher is None:
+                from src.watcher import FileWatcher  # watchfiles 只有 watch 模式需要
+                self.watcher = FileWatcher(paths, lambda changed: self.events.put(("changed", changed)))
+                self.watcher.start()
+            else:
+                self.watcher.update_paths(paths)
+
+        nxt = self.scheduler.next_fire_time() if self.scheduler else None
+        log("config.loaded", path=self.config_path, sets=[rs["name"] for rs in self.sets],
+            schedules=len(self.scheduler) if self.scheduler else None,
+            next_fire=nxt.isoformat(timespec="minutes") if nxt else None,
+            watching=len(input_paths(self.sets)) if self.watcher else None)
+
+    def _maybe_reload(self):
+        if _config_mtime(self.config_path) == self.config_mtime:
+            return
+        try:
+            self.load_config()
+        except (OSError, ValueError) as e:
+            # 設定寫到一半或內容有誤：沿用舊設定，下次醒來再試
+            log("config.error", logging.WARNING, path=self.config_path, error=f"{type(e).__name__}: {e}")
+            self.config_mtime = _config_mtime(self.config_path)
+
+    def _timeout(self) -> float:
+        nxt = self.scheduler.next_fire_time() if self.scheduler else None
+        if nxt is None:
+            return MAX_SLEEP_S
+        return min(MAX_SLEEP_S, max(0.0, (nxt - datetime.now()).total_seconds()))
+
+    def _run_due(self):
+        fires = self.scheduler.pop_due(datetime.now())
+        for f in fires:
+            if f.skipped:
+                log("schedule.skipped", at=f.at.isoformat(timespec="minutes"))
+            elif f.missed:
+                log("schedule.catch_up", at=f.at.isoformat(timespec="minutes"))
+        if any(not f.skipped for f in fires):
+            log("schedule.fired", sets=len(self.sets))
+            self.runner.submit(self.sets, "schedule")
+
+        consumed = [f.schedule for f in fires if f.schedule.get("mode") == "once"]
+        if consumed:
+            _remove_once(self.config_path, consumed)
+            self.config_mtime = _config_mtime(self.config_path)  # 自己寫入的變更不重新載入
+
+    def _on_signal(self, signum, _frame):
+        # 訊號處理函式中不碰 queue：主執行緒可能正持有 queue 的鎖，put 會 deadlock
+        self.stop_signal = signum
+        self._stopping.set()
+
+    def serve(self) -> int:
+        workers = self.args.workers or int(self.config.get("max_concurrent_jobs", DEFAULT_CONCURRENT_JOBS))
+        options = {"full": self.args.full, "pdf_backend": self.args.pdf_backend}
+        self.runner = Runner(workers, self.events, {k: v for k, v in options.items() if v})
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            signal.signal(sig, self._on_signal)
+
+        log("daemon.started", schedule=self.use_schedule, watch=self.use_watch, workers=workers)
+        try:
+            while True:
+                # 訊號只設定 _stopping；在這裡轉成 stop 事件，最多延遲 STOP_POLL_S
+                if self._stopping.is_set():
+                    event = ("stop", self.stop_signal)
+                else:
+                    try:
+                        event = self.events.get(timeout=min(STOP_POLL_S, self._timeout()))
+                    except queue.Empty:
+                        event = ("tick",)
+
+                kind = event[0]
+                if kind == "stop":
+                    log("daemon.stopping", signal=event[1], running=self.runner.jobs.running_count(),
+                        queued=self.runner.jobs.pending_count())
+                    break
+                if kind == "done":
+                    self.runner.on_done(event[1], event[2])
+                elif kind == "changed":
+                    changed = sets_for_paths(self.sets, event[1])
+                    log("files.changed", files=[os.path.basename(p) for p in event[1]],
+                        sets=[rs["name"] for rs in changed])
+                    self.runner.submit(changed, "watch")
+
+                self._maybe_reload()
+                if self.scheduler:
+                    self._run_due()
+        finally:
+            if self.watcher:
+                self.watcher.stop()
+            self.runner.close()
+        log("daemon.stopped")
+        return 0
+
+def cmd_run(args) -> int:
+    config = read_config(args.config)
+    sets = _select(resolve_report_sets(config, config.get("monitored_files", [])), args.names)
+    log("run.started", sets=[rs["name"] for rs in sets])
+    failed = 0
+    for res in run_report_sets(sets, args.workers, full=args.full, pdf_backend=args.pdf_backend):
+        if res["status"] == "ok":
+            log("report.done", set=res["id"], output=res["output"], cached=res.get("cached", False),
+                elapsed=res["elapsed"], spans=res.get("spans"))
+        else:
+            failed += 1
+            log("report.failed", logging.ERROR, set=res["id"], error=res["error"], elapsed=res["elapsed"],
+                spans=res.get("spans"))
+    log("run.finished", ok=len(sets) - failed, failed=failed)
+    return 1 if failed else 0
+
+def cmd_backfill(args) -> int:
+    from src.backfill import backfill  # pandas / matplotlib 只有實際產生報表時才載入
+
+    config = read_config(args.config)
+    sets = _select(resolve_report_sets(config, config.get("monitored_files", [])), args.names)
+    log("backfill.started", sets=[rs["name"] for rs in sets], period=args.period, start=args.start, end=args.end)
+    failed = 0
+    for rs in sets:
+        options = {k: rs[k] for k in OPTIONS if k in rs}
+        if args.pdf_backend:
+            options["pdf_backend"] = args.pdf_backend
+        start = datetime.now()
+        with recording() as rec:
+            try:
+                done = backfill(rs["sales"], rs["sales_info"], rs["client"], args.period, args.start, args.end,
+                                output_prefix=rs["output_prefix"], template=rs["template"], **options)
+            except Exception as e:
+                failed += 1
+                log("backfill.failed", logging.ERROR, set=rs["name"], error=f"{type(e).__name__}: {e}",
+                    spans=rec.spans)
+                continue
+        log("backfill.done", set=rs["name"], reports=len(done), first=done[0][0] if done else None,
+            last=done[-1][0] if done else None, elapsed=round((datetime.now() - start).total_seconds(), 3),
+            spans=rec.spans)
+    log("backfill.finished", ok=len(sets) - failed, failed=failed)
+    return 1 if failed else 0
+
+def cmd_daemon(args, schedule: bool, watch: bool) -> int:
+    daemon = Daemon(args, schedule, watch)
+    daemon.load_config()
+    if daemon.scheduler is not None and not len(daemon.scheduler) and not watch:
+        log("schedule.empty", logging.WARNING, path=args.config)
+    return daemon.serve()
+
+def build_parser() -> argparse.ArgumentParser:
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument("--config", default=CONFIG_PATH, help="Path to config.json")
+    common.add_argument("--set", action="append", default=[], dest="names", metavar="NAME",
+                        help="Only these report sets (repeatable)")
+    common.add_argument("--workers", type=int,
+                        help="Report processes (default: max_concurrent_jobs in config, or CPU count)")
+    common.add_argument("--full", action="store_true",
+                        help="Ignore stored aggregates and the report cache; rebuild from the first row "
+                             "(needed after editing rows in the middle of the sales file)")
+    common.add_argument("--pdf-backend", choices=BACKENDS, help="HTML to PDF converter (see src/pdf.py)")
+    common.add_argument("--log-format", choices=["json", "text"], default="json")
+    common.add_argument("--log-level", default="INFO")
+    common.add_argument("--log-file", help="Append logs to this file instead of stderr")
+
+    parser = argparse.ArgumentParser(prog="python -m ras", description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("run", parents=[common], help="Build the report sets once and exit")
+    sub.add_parser("schedule", parents=[common], help="Run the configured schedules")
+    p = sub.add_parser("watch", parents=[common], help="Rebuild report sets when their input files change")
+    p.add_argument("--schedule", action="store_true", help="Also run the configured schedules")
+    p = sub.add_parser("backfill", parents=[common], help="Build one report per period over a date range")
+    p.add_argument("--period", choices=["daily", "weekly", "monthly", "quarterly", "yearly"], required=True)
+    p.add_argument("--from", dest="start", metavar="DATE", help="First period, e.g. 2024-01 (default: first sale)")
+    p.add_argument("--to", dest="end", metavar="DATE", help="Last period, inclusive (default: last sale)")
+    return parser
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    setup(args.log_level, args.log_format, args.log_file)
+    try:
+        if args.command == "run":
+            code = cmd_run(args)
+        elif args.command == "backfill":
+            code = cmd_backfill(args)
+        else:
+            watch = args.command == "watch"
+            code = cmd_daemon(args, schedule=not watch or args.schedule, watch=watch)
+    except (OSError, ValueError) as e:
+        log("error", logging.ERROR, error=f"{type(e).__name__}: {e}")
+        code = 2
+    sys.exit(code)
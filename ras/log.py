@@ -0,0 +1,44 @@
+# ras/log.py
+"""結構化日誌：每筆一行 JSON（ts、level、pid、event 與其他欄位），
+多個 daemon 的輸出可以直接用 jq 或日誌系統彙整。--log-format text 則輸出給人看的單行格式。
+"""
+import sys
+import json
+import logging
+from datetime import datetime
+
+LOGGER_NAME = "ras"
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            "ts": datetime.fromtimestamp(record.created).isoformat(timespec="milliseconds"),
+            "level": record.levelname.lower(),
+            "pid": record.process,
+            "event": record.getMessage(),
+            **getattr(record, "fields", {}),
+        }
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+class TextFormatter(logging.Formatter):
+    def format(self, record):
+        fields = " ".join(f"{k}={v}" for k, v in getattr(record, "fields", {}).items())
+        line = f"{datetime.fromtimestamp(record.created):%Y-%m-%d %H:%M:%S} {record.levelname:<7} {record.getMessage()} {fields}"
+        if record.exc_info:
+            line += "\n" + self.formatException(record.exc_info)
+        return line.rstrip()
+
+def setup(level: str = "INFO", fmt: str = "json", path: str = None) -> logging.Logger:
+    """設定 ras logger；path 有值時寫入檔案，否則寫到 stderr。"""
+    handler = logging.FileHandler(path, encoding="utf-8") if path else logging.StreamHandler(sys.stderr)
+    handler.setFormatter(JsonFormatter() if fmt == "json" else TextFormatter())
+    logger = logging.getLogger(LOGGER_NAME)
+    logger.handlers[:] = [handler]
+    logger.setLevel(level.upper())
+    logger.propagate = False
+    return logger
+
+def log(event: str, level: int = logging.INFO, **fields):
+    logging.getLogger(LOGGER_NAME).log(level, event, extra={"fields": fields})
@@ -0,0 +1,493 @@
+# src/aggregate.py
+"""銷售資料的合併與彙總。
+
+enrich_sales 把 sales 對上 sales_info / client 一次；SalesTotals 保存報表需要的
+四種彙總（每日、每個 sale_id、每個產品、每個客戶）。
+
+update_totals 針對只會附加（append-only）的 sales.csv 做增量彙總：記住已處理到的
+byte offset 與筆數，下次只解析新增的列並併入已存檔的彙總；若偵測到檔案被截斷或
+改寫（只取樣開頭與 offset 前各一段，中間的修改需以 --full 重建），或 sales_info 的價格變了，
+就整份重建。Excel 工作表無法以 offset 續讀：活頁簿未變時直接
+沿用存檔的彙總，變了就從 ingest 的欄式快取（每張工作表只解析一次）整張重新彙總。
+同一個 sales 檔的存檔以檔案鎖保護，多個報表組共用一份 sales 時依序更新；彙總寫到新檔後再以
+state.json 一次切換，不會出現 state 與彙總不一致的中間狀態。
+
+新增的資料以每次 CHUNK_ROWS 列串流解析：每塊只以產品代碼查價格（查表在整次更新中只建一次），
+算出該塊的部分彙總後即丟棄原始列。部分彙總的大小只與日期 / 產品 / 客戶 / sale_id 的數量有關，
+每累積 COMBINE_EVERY 塊合併一次，因此記憶體峰值不隨檔案大小成長。客戶名稱等對照在出報表時
+才以彙總後的代碼查詢，彙總階段不需要 client 表。
+"""
+import os
+import io
+import json
+import time
+import hashlib
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+
+if os.name == "nt":
+    import msvcrt
+else:
+    import fcntl
+
+import numpy as np
+import pandas as pd
+
+from src.ingest import ROOT, csv_options, is_excel, read_table, source_file
+from src.spans import add_span
+
+AGG_DIR = os.path.join(ROOT, "cache", "aggregates")
+
+# 狀態格式變更時遞增，舊狀態會整份重建（2：daily 改以日期彙總；3：client_id 改為 float64；4：sale_id 改為字串；
+# 5：彙總檔名記在 state 中）
+STATE_VERSION = 5
+
+# 用來判斷檔案是否被改寫的取樣長度（開頭與 offset 前各取一段）
+_PROBE_BYTES = 64 * 1024
+
+# 串流彙總：每塊解析的列數，以及累積幾塊部分彙總後合併一次
+CHUNK_ROWS = 250_000
+COMBINE_EVERY = 8
+
+# ---------------- 合併 ----------------
+
+def enrich_sales(sales: pd.DataFrame, sales_info: pd.DataFrame, client: pd.DataFrame = None) -> pd.DataFrame:
+    """一次性把 sales 對上 sales_info / client，後續所有聚合與作圖都讀這張表。
+
+    以 index 位置查表取代 merge：不存在於 sales_info 的產品會被排除（與原本 inner merge 相同），
+    找不到的 client 則保留為 NaN（與原本 left merge 相同）。
+    """
+    products = sales_info.drop_duplicates("product_code")
+    pos = pd.Index(np.asarray(products["product_code"], dtype=object)).get_indexer(
+        np.asarray(sales["product_code"], dtype=object))
+    keep = pos >= 0
+    pos = pos[keep]
+
+    df = sales.loc[keep, ["sale_id", "client_id", "sale_date", "amount", "product_code"]].reset_index(drop=True)
+    df["product_name"] = pd.Categorical(products["product_name"].to_numpy()[pos])
+    df["total"] = df["amount"].to_numpy() * products["price"].to_numpy()[pos]
+    df["sale_date"] = pd.to_datetime(df["sale_date"])
+
+    if client is not None:
+        clients = client.drop_duplicates("client_id")
+        cpos = pd.Index(clients["client_id"]).get_indexer(df["client_id"])
+        names = clients["client_name"].to_numpy(dtype=object)
+        df["client_name"] = pd.Categorical(np.where(cpos >= 0, names[cpos], None))
+    return df
+
+class PriceLookup:
+    """product_code -> price 的查表（hash index），整次更新只建一次，每塊資料共用。"""
+
+    def __init__(self, sales_info: pd.DataFrame):
+        products = sales_info.drop_duplicates("product_code")
+        self.index = pd.Index(np.asarray(products["product_code"], dtype=object))
+        self.prices = products["price"].to_numpy(dtype="float64")
+
+    def positions(self, codes) -> np.ndarray:
+        """各代碼在查表中的位置；不存在的為 -1。"""
+        return self.index.get_indexer(np.asarray(codes, dtype=object))
+
+# ---------------- 彙總 ----------------
+
+def _empty_series() -> pd.Series:
+    return pd.Series(dtype="float64", name="total")
+
+def _sum_by(df: pd.DataFrame, key: str) -> pd.Series:
+    # 以原始值分組（不用 categorical），不同批次的彙總才能直接相加
+    keys = np.asarray(df[key], dtype=object) if isinstance(df[key].dtype, pd.CategoricalDtype) else df[key]
+    return df["total"].groupby(keys).sum().rename_axis(key)
+
+def _sum_by_day(df: pd.DataFrame) -> pd.Series:
+    # 以日期（去掉時間）分組：筆數再多，每日彙總的大小也只與天數有關
+    days = pd.DatetimeIndex(df["sale_date"]).normalize()
+    return df["total"].groupby(days).sum().rename_axis("sale_date")
+
+@dataclass
+class SalesTotals:
+    """報表需要的四種彙總，皆以 total 加總；可互相合併。"""
+    daily: pd.Series = field(default_factory=_empty_series)        # index: sale_date（日期）
+    by_sale_id: pd.Series = field(default_factory=_empty_series)   # index: sale_id
+    by_product: pd.Series = field(default_factory=_empty_series)   # index: product_code
+    by_client: pd.Series = field(default_factory=_empty_series)    # index: client_id
+    rows: int = 0
+
+    @classmethod
+    def from_enriched(cls, df: pd.DataFrame) -> "SalesTotals":
+        return cls(
+            daily=_sum_by_day(df),
+            by_sale_id=_sum_by(df, "sale_id"),
+            by_product=_sum_by(df, "product_code"),
+            by_client=_sum_by(df, "client_id"),
+            rows=len(df),
+        )
+
+    @classmethod
+    def from_sales(cls, sales: pd.DataFrame, sales_info: pd.DataFrame) -> "SalesTotals":
+        totals = cls.from_enriched(enrich_sales(sales, sales_info))
+        totals.rows = len(sales)  # 記錄讀入的原始筆數（含對不到產品的列）
+        return totals
+
+    @classmethod
+    def from_chunk(cls, chunk: pd.DataFrame, prices: PriceLookup) -> "SalesTotals":
+        """一塊 sales 的部分彙總；只取彙總需要的欄位，不建立完整的 enrich 表。
+
+        結果與 from_sales 相同：不存在於 sales_info 的產品不列入，rows 為讀入的原始筆數。
+        """
+        pos = prices.positions(chunk["product_code"])
+        keep = pos >= 0
+        df = pd.DataFrame({
+            "sale_date": pd.to_datetime(chunk["sale_date"].to_numpy()[keep]),
+            "sale_id": chunk["sale_id"].to_numpy()[keep],
+            "product_code": np.asarray(chunk["product_code"], dtype=object)[keep],
+            "client_id": chunk["client_id"].to_numpy()[keep],
+            "total": chunk["amount"].to_numpy()[keep] * prices.prices[pos[keep]],
+        })
+        totals = cls.from_enriched(df)
+        totals.rows = len(chunk)
+        return totals
+
+    @classmethod
+    def combine(cls, parts) -> "SalesTotals":
+        """合併多份部分彙總（相同鍵相加）。"""
+        parts = list(parts)
+
+        def total(name):
+            series = [getattr(p, name) for p in parts if not getattr(p, name).empty]
+            if not series:
+                return _empty_series()
+            if len(series) == 1:
+                return series[0]
+            return pd.concat(series).groupby(level=0).sum()
+
+        return cls(
+            daily=total("daily").sort_index(),
+            by_sale_id=total("by_sale_id"),
+            by_product=total("by_product"),
+            by_client=total("by_client"),
+            rows=sum(p.rows for p in parts),
+        )
+
+    def merge(self, other: "SalesTotals") -> "SalesTotals":
+        return SalesTotals.combine([self, other])
+
+    def save(self, path: str):
+        tmp = path + ".tmp"
+        pd.to_pickle({
+            "daily": self.daily,
+            "by_sale_id": self.by_sale_id,
+            "by_product": self.by_product,
+            "by_client": self.by_client,
+            "rows": self.rows,
+        }, tmp)
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path: str) -> "SalesTotals":
+        return cls(**pd.read_pickle(path))
+
+# ---------------- 依期間彙總 ----------------
+
+# 期間粒度 -> pandas 的 period 頻率（週為週一至週日）
+PERIODS = {"daily": "D", "weekly": "W-SUN", "monthly": "M", "quarterly": "Q", "yearly": "Y"}
+
+def period_totals(sales: pd.DataFrame, prices: PriceLookup, freq: str, start=None, end=None) -> dict:
+    """把 sales 依期間切開彙總，回傳 {pd.Period: SalesTotals}（只含有資料的期間，依時間排序）。
+
+    每種彙總只做一次 groupby([期間, 鍵])，再依期間拆開，不必逐期間重新過濾整張表。
+    start / end 為包含的時間界線（None 表示不限）；各期間的結果與只用該期間的列呼叫 from_chunk 相同。
+    """
+    dates = pd.DatetimeIndex(pd.to_datetime(sales["sale_date"].to_numpy()))
+    in_range = np.ones(len(dates), dtype=bool)
+    if start is not None:
+        in_range &= dates >= start
+    if end is not None:
+        in_range &= dates <= end
+    pos = prices.positions(sales["product_code"])
+    keep = in_range & (pos >= 0)
+
+    periods = dates.to_period(freq)
+    df = pd.DataFrame({
+        "period": periods[keep],
+        "sale_date": dates[keep].normalize(),
+        "sale_id": sales["sale_id"].to_numpy()[keep],
+        "product_code": np.asarray(sales["product_code"], dtype=object)[keep],
+        "client_id": sales["client_id"].to_numpy()[keep],
+        "total": sales["amount"].to_numpy()[keep] * prices.prices[pos[keep]],
+    })
+
+    rows = periods[in_range].value_counts()
+    parts = {p: {} for p in rows.index}
+    for name, key in (("daily", "sale_date"), ("by_sale_id", "sale_id"),
+                      ("by_product", "product_code"), ("by_client", "client_id")):
+        sums = df.groupby(["period", key], sort=True)["total"].sum()
+        for p, sub in sums.groupby(level="period", sort=False):
+            parts[p][name] = sub.droplevel("period")
+    return {p: SalesTotals(**parts[p], rows=int(rows[p])) for p in sorted(parts)}
+
+# ---------------- 排行 ----------------
+
+OTHER_LABEL = "Other"
+
+def top_with_other(df: pd.DataFrame, label_col: str, top_n: int = None,
+                   other_label: str = OTHER_LABEL) -> pd.DataFrame:
+    """依 total 取前 top_n 名（由大到小），其餘合併成最後一列 other_label。
+
+    以 nlargest 做部分選取，不必排序全部分組；圓餅圖的比例因此仍以全部金額為分母。
+    top_n 為 None 或分組數不超過 top_n 時，回傳全部分組（由大到小）。
+    """
+    if not top_n or len(df) <= top_n:
+        return df.sort_values("total", ascending=False)
+    top = df.nlargest(top_n, "total")
+    rest = df["total"].to_numpy()[~df.index.isin(top.index)].sum()
+    if rest <= 0:
+        return top
+    other = pd.DataFrame({label_col: [other_label], "total": [rest]})
+    return pd.concat([top, other], ignore_index=True)
+
+# ---------------- 增量彙總 ----------------
+
+class _Slice(io.RawIOBase):
+    """只讀取檔案 [offset, offset + length) 區段的 file-like，讓 read_csv 不必先把資料複製到記憶體。"""
+
+    def __init__(self, f, length: int):
+        self._f = f
+        self._left = length
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        n = min(len(b), self._left)
+        if n <= 0:
+            return 0
+        data = self._f.read(n)
+        b[:len(data)] = data
+        self._left -= len(data)
+        return len(data)
+
+def _probe(f, start: int, end: int) -> str:
+    """取 [start, end) 的 sha256，用來確認已處理的內容沒有被改寫。"""
+    f.seek(start)
+    return hashlib.sha256(f.read(end - start)).hexdigest()
+
+def _probes(f, offset: int) -> dict:
+    return {
+        "head_sha": _probe(f, 0, min(offset, _PROBE_BYTES)),
+        "tail_sha": _probe(f, max(0, offset - _PROBE_BYTES), offset),
+    }
+
+def _complete_end(f, size: int) -> int:
+    """回傳最後一個換行之後的位置；還在寫入中的半行留待下次處理。"""
+    pos = size
+    while pos > 0:
+        start = max(0, pos - 4096)
+        f.seek(start)
+        block = f.read(pos - start)
+        i = block.rfind(b"\n")
+        if i >= 0:
+            return start + i + 1
+        pos = start
+    return 0
+
+def _prices_key(sales_info: pd.DataFrame) -> str:
+    # 彙總依賴價格；產品名稱等其他欄位在出報表時才對照，不影響已存的彙總
+    prices = sales_info[["product_code", "price"]].astype(str).to_csv(index=False)
+    return hashlib.sha256(prices.encode("utf-8")).hexdigest()
+
+def _store_dir(path: str, store_dir: str) -> str:
+    key = hashlib.sha1(os.path.abspath(path).encode("utf-8")).hexdigest()
+    return os.path.join(store_dir, key)
+
+def _read_state(entry: str):
+    try:
+        with open(os.path.join(entry, "state.json"), "r", encoding="utf-8") as f:
+            state = json.load(f)
+    except (OSError, ValueError):
+        return None
+    return state if state.get("version") == STATE_VERSION else None
+
+def _stream_totals(reader, totals: SalesTotals, prices: PriceLookup, options: dict,
+                   incremental: bool, nbytes: int) -> SalesTotals:
+    """逐塊解析 reader 並把部分彙總併入 totals；解析與彙總的時間分別記成 span。"""
+    parts = [totals]
+    parse_s = agg_s = 0.0
+    rows = chunks = 0
+    with pd.read_csv(reader, chunksize=CHUNK_ROWS, **options) as it:
+        while True:
+            t0 = time.perf_counter()
+            chunk = next(it, None)
+            t1 = time.perf_counter()
+            parse_s += t1 - t0
+            if chunk is None:
+                break
+            parts.append(SalesTotals.from_chunk(chunk, prices))
+            if len(parts) > COMBINE_EVERY:
+                parts = [SalesTotals.combine(parts)]
+            agg_s += time.perf_counter() - t1
+            rows += len(chunk)
+            chunks += 1
+
+    t0 = time.perf_counter()
+    totals = SalesTotals.combine(parts)
+    agg_s += time.perf_counter() - t0
+    add_span("load.sales", parse_s * 1000, incremental=incremental, bytes=nbytes, rows=rows, chunks=chunks)
+    add_span("aggregate", agg_s * 1000, rows=rows)
+    return totals
+
+@contextmanager
+def _store_lock(entry: str):
+    """同一個 sales 檔的彙總存檔一次只給一個 process / 執行緒更新（跨 process 的檔案鎖）。
+
+    多個報表組（或報表組與預設報表）共用同一份 sales 時可能同時執行 update_totals；
+    不鎖的話 offset 與彙總會交錯，造成重複計算或漏列。
+    """
+    os.makedirs(entry, exist_ok=True)
+    with open(os.path.join(entry, "lock"), "a+b") as f:
+        if os.name == "nt":
+            f.seek(0)
+            while True:
+                try:
+                    msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+                    break
+                except OSError:  # LK_LOCK 約 10 秒後放棄，繼續等
+                    continue
+        else:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if os.name == "nt":
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+            else:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+def _load_totals(entry: str, state: dict) -> SalesTotals:
+    return SalesTotals.load(os.path.join(entry, state["totals"]))
+
+def _save_totals(entry: str, totals: SalesTotals, state: dict):
+    """彙總寫到新的檔案，再以取代 state.json 一次生效：state 與彙總永遠是同一次更新的結果。"""
+    os.makedirs(entry, exist_ok=True)
+    name = f"totals.{time.time_ns()}.pkl"
+    totals.save(os.path.join(entry, name))
+    tmp = os.path.join(entry, "state.json.tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump({"version": STATE_VERSION, **state, "totals": name}, f, ensure_ascii=False, indent=2)
+    os.replace(tmp, os.path.join(entry, "state.json"))
+    for old in os.listdir(entry):
+        if old.startswith("totals.") and old.endswith(".pkl") and old != name:
+            try:
+                os.remove(os.path.join(entry, old))
+            except OSError:
+                pass
+
+def _sheet_totals(sales_path: str, sales_info: pd.DataFrame, entry: str, rebuild: bool) -> SalesTotals:
+    """Excel 工作表的彙總：活頁簿（mtime、大小）與價格都沒變就沿用存檔，否則整張重新彙總。"""
+    start = time.perf_counter()
+    state = None if rebuild else _read_state(entry)
+    prices_key = _prices_key(sales_info)
+    st = os.stat(source_file(sales_path))
+    source = {"mtime_ns": st.st_mtime_ns, "size": st.st_size}
+
+    if state is not None and state.get("source") == source and state["prices_key"] == prices_key:
+        add_span("load.sales", (time.perf_counter() - start) * 1000, incremental=True, rows=0, bytes=0)
+        return _load_totals(entry, state)
+
+    t0 = time.perf_counter()
+    sales = read_table(sales_path, "sales")
+    t1 = time.perf_counter()
+    prices = PriceLookup(sales_info)
+    parts = [SalesTotals.from_chunk(sales.iloc[lo:lo + CHUNK_ROWS], prices)
+             for lo in range(0, len(sales), CHUNK_ROWS)]
+    totals = SalesTotals.combine(parts) if parts else SalesTotals()
+    add_span("load.sales", (t1 - t0) * 1000, incremental=False, bytes=st.st_size, rows=len(sales),
+             chunks=len(parts))
+    add_span("aggregate", (time.perf_counter() - t1) * 1000, rows=len(sales))
+
+    _save_totals(entry, totals, {
+        "path": sales_path,
+        "rows": totals.rows,
+        "prices_key": prices_key,
+        "source": source,
+    })
+    return totals
+
+def _tail_totals(f, start: int, end: int, header: list, prices: PriceLookup) -> SalesTotals:
+    """解析 [start, end) 這段沒有結尾換行的最後一列（不寫入存檔）。"""
+    f.seek(start)
+    tail = pd.read_csv(io.BytesIO(f.read(end - start)), header=None, names=header, **csv_options("sales", header))
+    return SalesTotals.from_chunk(tail, prices)
+
+def update_totals(sales_path: str, sales_info: pd.DataFrame, store_dir: str = AGG_DIR,
+                  rebuild: bool = False) -> SalesTotals:
+    """增量更新 sales_path 的彙總並回傳。
+
+    只解析上次 offset 之後新增的完整列；檔案變短、開頭或 offset 前 64 KB 的內容被改寫、
+    sales_info 價格改變或 rebuild=True 時，從頭重建。只比對這兩段取樣：在中間改寫既有的列
+    （且長度不變或變長）偵測不到，需以 rebuild=True（--full）重建。
+
+    最後一列沒有換行時，若檔案大小與上次相同（已寫完）或這次是從頭建立，也一併計入回傳的彙總；
+    這一列不寫入存檔，offset 停在最後一個換行，之後續寫完成時會重新解析。
+    sales_path 為 Excel 工作表時見 _sheet_totals。
+    """
+    entry = _store_dir(sales_path, store_dir)
+    with _store_lock(entry):
+        if is_excel(sales_path):
+            return _sheet_totals(sales_path, sales_info, entry, rebuild)
+        return _csv_totals(sales_path, sales_info, entry, rebuild)
+
+def _csv_totals(sales_path: str, sales_info: pd.DataFrame, entry: str, rebuild: bool) -> SalesTotals:
+    start = time.perf_counter()
+    state = None if rebuild else _read_state(entry)
+    prices_key = _prices_key(sales_info)
+    size = os.path.getsize(sales_path)
+    prices = PriceLookup(sales_info)
+
+    with open(sales_path, "rb") as f:
+        if state is not None:
+            offset = state["offset"]
+            if (state["prices_key"] != prices_key or size < offset
+                    or _probes(f, offset) != {"head_sha": state["head_sha"], "tail_sha": state["tail_sha"]}):
+                state = None
+
+        if state is None:
+            totals, offset, header = SalesTotals(), 0, None
+        else:
+            totals = _load_totals(entry, state)
+            header = state["header"]
+
+        end = _complete_end(f, size)
+        changed = state is None or state.get("size") != size
+        if end > offset:
+            f.seek(offset)
+            reader = io.BufferedReader(_Slice(f, end - offset))
+            if header is None:
+                header = list(pd.read_csv(sales_path, nrows=0).columns)
+                options = {"header": 0}
+            else:
+                options = {"header": None, "names": header}
+            totals = _stream_totals(reader, totals, prices, {**options, **csv_options("sales", header)},
+                                    incremental=offset > 0, nbytes=end - offset)
+            offset = end
+        elif state is not None:
+            # 沒有新的完整列
+            add_span("load.sales", (time.perf_counter() - start) * 1000, incremental=True, rows=0, bytes=0)
+
+        if changed:
+            probes = _probes(f, offset)
+        # 沒有結尾換行的最後一列：大小沒變（已寫完）或從頭建立時才計入
+        tail = None
+        if header is not None and end < size and (state is None or state.get("size") == size):
+            tail = _tail_totals(f, end, size, header, prices)
+
+    if changed:
+        _save_totals(entry, totals, {
+            "path": os.path.abspath(sales_path),
+            "offset": offset,
+            "size": size,
+            "rows": totals.rows,
+            "header": header,
+            "prices_key": prices_key,
+            **probes,
+        })
+    return totals if tail is None else SalesTotals.combine([totals, tail])
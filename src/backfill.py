@@ -0,0 +1,119 @@
+# src/backfill.py
+"""回補（backfill）：一次產生一段日期範圍內每個期間的報表。
+
+    python -m src.backfill --sales files/sales.csv --sales-info files/sales_info.csv \
+        --client files/client.csv --period monthly --from 2024-01 --to 2025-12
+
+sales 只載入一次（經 ingest 的欄式快取），以 period_totals 一次分組出所有期間的彙總；
+每 BATCH_REPORTS 個期間一批交給 build_reports：圖在 process pool 中平行繪製，PDF 批次轉換。
+範圍會對齊到完整的期間（--period monthly --from 2024-01-15 從 2024-01-01 開始），沒有資料的期間略過。
+輸出檔名為 <output_prefix>_backfill_<粒度>_<期間>，例如 report_backfill_monthly_2024-01、
+report_backfill_weekly_2024-W03；與平常的 <output_prefix>_<日期> 報表（及其 manifest）不會撞名。
+回補不讀寫 update_totals 的增量彙總存檔，與平常的報表互不影響。
+"""
+import os
+import sys
+import time
+import argparse
+
+import pandas as pd
+
+if __package__ in (None, ""):
+    sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from src import charts
+from src.ingest import read_table
+from src.aggregate import PERIODS, PriceLookup, period_totals
+from src.task import IMAGE_MODES, build_reports
+from src.pdf import BACKENDS
+from src.spans import JsonLinesSink, recording, span
+
+# 每批的報表數：一批的圖檔會同時留在記憶體中，批次太大時改為分批產生
+BATCH_REPORTS = 24
+
+def period_label(p: pd.Period) -> str:
+    """輸出檔名中的期間：2024-01-05、2024-W01（ISO 週）、2024-01、2024Q1、2024。"""
+    if p.freqstr.startswith("W"):
+        iso = p.start_time.isocalendar()
+        return f"{iso.year}-W{iso.week:02d}"
+    return str(p)
+
+def period_range(period: str, start: str = None, end: str = None):
+    """把 --from / --to 對齊到完整的期間，回傳 (start, end) 時間界線（皆包含）。"""
+    if period not in PERIODS:
+        raise ValueError(f"Unknown period: {period!r} (expected one of {', '.join(PERIODS)})")
+    freq = PERIODS[period]
+    lo = pd.Period(start, freq).start_time if start else None
+    hi = pd.Period(end, freq).end_time if end else None
+    if lo is not None and hi is not None and lo > hi:
+        raise ValueError(f"Empty date range: {start} > {end}")
+    return lo, hi
+
+def backfill(sales_path: str, sales_info_path: str, client_path: str, period: str = "monthly",
+             start: str = None, end: str = None, output_prefix: str = "report",
+             batch: int = BATCH_REPORTS, **options) -> list:
+    """產生範圍內每個有資料的期間的報表，回傳 [(期間標籤, PDF 路徑), ...]。
+
+    options 傳給 build_reports（images、chart_formats、trend、template、pdf_backend）。
+    """
+    lo, hi = period_range(period, start, end)
+
+    with span("load.sales_info") as s:
+        sales_info = read_table(sales_info_path, "sales_info")
+        s["rows"] = len(sales_info)
+    with span("load.client") as s:
+        client = read_table(client_path, "client")
+        s["rows"] = len(client)
+    with span("load.sales") as s:
+        sales = read_table(sales_path, "sales")
+        s["rows"] = len(sales)
+
+    with span("aggregate", period=period, rows=len(sales)) as s:
+        totals = period_totals(sales, PriceLookup(sales_info), PERIODS[period], lo, hi)
+        s["periods"] = len(totals)
+
+    items = [(t, f"{output_prefix}_backfill_{period}_{period_label(p)}") for p, t in totals.items()]
+    labels = [period_label(p) for p in totals]
+    pdfs = []
+    for i in range(0, len(items), max(1, batch)):
+        pdfs += build_reports(items[i:i + batch], sales_info, client, **options)
+    return list(zip(labels, pdfs))
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build one report per period over a date range")
+    parser.add_argument("--sales", required=True, help="Path to sales.csv (or workbook.xlsx#sheet)")
+    parser.add_argument("--sales-info", required=True, help="Path to sales_info.csv (or workbook.xlsx#sheet)")
+    parser.add_argument("--client", required=True, help="Path to client.csv (or workbook.xlsx#sheet)")
+    parser.add_argument("--period", choices=PERIODS, default="monthly", help="Report granularity")
+    parser.add_argument("--from", dest="start", metavar="DATE",
+                        help="First period, e.g. 2024-01 (default: first sale)")
+    parser.add_argument("--to", dest="end", metavar="DATE", help="Last period, inclusive (default: last sale)")
+    parser.add_argument("--template", help="Markdown template (default: templates/pdf_templates.md)")
+    parser.add_argument("--output-prefix", default="report", help="Output file name prefix")
+    parser.add_argument("--pdf-backend", choices=BACKENDS, help="HTML to PDF converter (default: RAS_PDF_BACKEND or auto)")
+    parser.add_argument("--images", choices=IMAGE_MODES, default="inline",
+                        help="Embed charts as base64 (inline) or write them next to the HTML (files)")
+    parser.add_argument("--batch", type=int, default=BATCH_REPORTS, help="Reports rendered and converted together")
+    parser.add_argument("--chart-workers", type=int, help="Processes used to render charts (default: CHART_WORKERS)")
+    parser.add_argument("--spans", metavar="PATH",
+                        help="Write per-stage timings as JSON lines to PATH ('-' for stdout)")
+    args = parser.parse_args(argv)
+    if args.chart_workers:
+        charts.CHART_WORKERS = args.chart_workers
+
+    try:
+        period_range(args.period, args.start, args.end)
+    except ValueError as e:  # 包含無法解析的日期
+        parser.error(str(e))
+
+    start = time.perf_counter()
+    with recording(JsonLinesSink(args.spans) if args.spans else None):
+        done = backfill(args.sales, args.sales_info, args.client, args.period, args.start, args.end,
+                        output_prefix=args.output_prefix, batch=args.batch, images=args.images,
+                        template=args.template, pdf_backend=args.pdf_backend)
+    for label, pdf in done:
+        print(f"{label}: OK ->", pdf)
+    print(f"{len(done)} report(s) in {time.perf_counter() - start:.2f}s")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,300 @@
+# src/charts.py
+"""報表圖表。
+
+每張圖以 ChartSpec（圖種 + 已彙總的資料 + 版面參數）描述，render_charts 把多張圖
+分送到 Agg 後端的 process pool 平行繪製，再依原順序收回圖檔位元組。
+輸出格式見 FORMATS（PNG、SVG、對長序列做路徑簡化的 SVG），可依圖種分別設定；
+要內嵌到 HTML 時再用 data_uri 轉成 base64。
+pool 在第一次使用時建立並保留，常駐 worker 之後的工作不必再付啟動成本。
+
+繪製結果另存於以內容定址的磁碟快取：key 由資料雜湊、圖種與所有繪圖參數
+（含 figsize、dpi 等預設值）組成，彙總沒變的圖直接取用，不經過 matplotlib。
+快取總大小超過 CHART_CACHE_MAX_BYTES 時，依最近使用時間淘汰最舊的檔案。
+"""
+import os
+import io
+import json
+import time
+import base64
+import atexit
+import hashlib
+import inspect
+from dataclasses import dataclass, field
+from concurrent.futures import ProcessPoolExecutor
+
+import matplotlib
+import matplotlib.pyplot as plt
+import pandas as pd
+
+from src.ingest import ROOT
+from src.aggregate import OTHER_LABEL
+from src.spans import add_span
+from src.downsample import downsample as _downsample, resample_totals
+
+# 同時繪圖的 process 數；設為 1 則在目前的 process 依序繪製
+CHART_WORKERS = min(4, os.cpu_count() or 1)
+
+CHART_CACHE_DIR = os.path.join(ROOT, "cache", "charts")
+CHART_CACHE_MAX_BYTES = 64 * 1024 * 1024
+
+# 繪圖程式的外觀有變動時遞增，讓舊的快取圖失效
+CHART_STYLE_VERSION = 1
+
+# 輸出格式 -> (MIME, 副檔名, 存檔時套用的 rcParams)
+FORMATS = {
+    "png": ("image/png", ".png", {}),
+    "svg": ("image/svg+xml", ".svg", {}),
+    # 長時間序列：合併在像素尺度內幾乎共線的點，SVG 路徑大幅變短
+    "svg-simplified": ("image/svg+xml", ".svg", {"path.simplify": True, "path.simplify_threshold": 1.0}),
+}
+
+# 各圖種預設的輸出格式
+CHART_FORMATS = {
+    "pie": "png",
+    "line": "png",
+}
+
+@dataclass
+class ChartSpec:
+    kind: str                                       # RENDERERS 的 key
+    data: pd.DataFrame                              # 已彙總的資料
+    params: dict = field(default_factory=dict)      # 傳給繪圖函式的其餘參數
+
+# ---------------- 繪圖 ----------------
+
+def _fig_to_bytes(fig, dpi: int = 150, fmt: str = "png") -> bytes:
+    buf = io.BytesIO()
+    _, ext, rc = FORMATS[fmt]
+    # 固定邊界與 DPI，避免每張圖被不同程度裁切（DPI 只影響 PNG）
+    with plt.rc_context(rc):
+        fig.savefig(buf, format=ext[1:], bbox_inches=None, dpi=dpi, pad_inches=0.05,
+                    metadata={"Date": None} if ext == ".svg" else None)  # SVG 不寫入時間，內容可重現
+    plt.close(fig)
+    return buf.getvalue()
+
+def mime_type(fmt: str) -> str:
+    return FORMATS[fmt][0]
+
+def file_ext(fmt: str) -> str:
+    return FORMATS[fmt][1]
+
+def data_uri(img: bytes, mime: str = "image/png") -> str:
+    return f"data:{mime};base64," + base64.b64encode(img).decode("ascii")
+
+# 排行之外合併的 "Other" 用中性灰，不與前幾名的顏色混淆
+OTHER_COLOR = "#bdbdbd"
+
+def pie_chart(df, label_col, title, figsize=(4.2, 4.2), dpi=150, fmt="png") -> bytes:
+    fig, ax = plt.subplots(figsize=figsize, constrained_layout=False)
+    colors = [OTHER_COLOR if str(label) == OTHER_LABEL else f"C{i}" for i, label in enumerate(df[label_col])]
+    wedges, texts, autotexts = ax.pie(
+        df["total"],
+        labels=df[label_col],
+        colors=colors,
+        autopct="%.1f%%",
+        startangle=90,
+        labeldistance=1.05,   # 統一標籤距離
+        pctdistance=0.75,
+        radius=1.0
+        )
+    ax.set_aspect("equal")
+
+    # ax.set_title(title, pad=4)
+
+    # 圖例放下方，避免影響圓的可用空間
+    ax.legend(
+        wedges,
+        df[label_col],
+        loc="lower center",
+        bbox_to_anchor=(0.5, -0.08),
+        ncol=2,
+        frameon=False,
+        fontsize=8
+    )
+
+    # 固定子圖邊界，確保三張圖留白一致
+    fig.subplots_adjust(left=0.15, right=0.95, top=0.88, bottom=0.12)
+
+    return _fig_to_bytes(fig, dpi, fmt)
+
+def pie_b64(df, label_col, title, **kwargs) -> str:
+    return base64.b64encode(pie_chart(df, label_col, title, **kwargs)).decode("ascii")
+
+# 折線圖專用字級；用 rc_context 套用，避免影響同一個 process 之後畫的其他圖
+LINE_RC = {
+    "axes.titlesize": 7,
+    "axes.labelsize": 7,
+    "xtick.labelsize": 6,
+    "ytick.labelsize": 6,
+}
+
+def line_daily_chart(daily: pd.DataFrame, max_xticks: int = 12, figsize=(5, 1.5), dpi=150,
+                     fmt="png", downsample: str = "minmax", resample: str = None) -> bytes:
+    """每日趨勢折線圖。
+
+    resample："weekly" / "monthly" 先加總成週 / 月。
+    downsample："minmax" / "lttb" / None；點數超過圖寬像素時降到約一個像素一點，
+    繪圖成本只跟圖的解析度有關，不隨歷史長度增加。
+    """
+    with plt.rc_context(LINE_RC):
+        return _line_daily(daily, max_xticks, figsize, dpi, fmt, downsample, resample)
+
+def line_daily_b64(daily: pd.DataFrame, **kwargs) -> str:
+    return base64.b64encode(line_daily_chart(daily, **kwargs)).decode("ascii")
+
+def _line_daily(daily: pd.DataFrame, max_xticks: int, figsize, dpi, fmt, downsample, resample) -> bytes:
+    if resample:
+        daily = resample_totals(daily, resample)
+    points = _downsample(daily, int(figsize[0] * dpi), downsample)
+
+    fig, ax = plt.subplots(figsize=figsize)
+    ax.plot(points["sale_date"], points["total"], linewidth=1)
+
+    # 刻度依完整序列等距挑選，只對挑出的日期做字串格式化
+    step = max(1, len(daily) // max_xticks)
+    ticks = daily["sale_date"].iloc[::step]
+    ax.set_xticks(ticks)
+    ax.set_xticklabels(ticks.dt.strftime("%Y-%m-%d"), rotation=45, ha="right")
+
+    ax.set_xlabel("Sale Date", labelpad=3)
+    ax.set_ylabel("Total Sales")
+    # ax.set_title("Daily Sales Trend", pad=4)
+
+    fig.subplots_adjust(left=0.1, right=0.9, top=0.9, bottom=0.32)
+    return _fig_to_bytes(fig, dpi, fmt)
+
+RENDERERS = {
+    "pie": pie_chart,
+    "line": line_daily_chart,
+}
+
+def render_chart(spec: ChartSpec) -> bytes:
+    return RENDERERS[spec.kind](spec.data, **spec.params)
+
+# ---------------- 快取 ----------------
+
+def chart_key(spec: ChartSpec) -> str:
+    """資料內容 + 圖種 + 完整繪圖參數（含預設的 figsize / dpi）+ 樣式版本的雜湊。"""
+    bound = inspect.signature(RENDERERS[spec.kind]).bind(spec.data, **spec.params)
+    bound.apply_defaults()
+    params = dict(list(bound.arguments.items())[1:])  # 第一個參數是資料本身
+
+    h = hashlib.sha256()
+    h.update(json.dumps({
+        "kind": spec.kind,
+        "params": params,
+        "columns": [str(c) for c in spec.data.columns],
+        "dtypes": [str(t) for t in spec.data.dtypes],
+        "style": CHART_STYLE_VERSION,
+        "line_rc": LINE_RC,
+        "formats": FORMATS,
+        "matplotlib": matplotlib.__version__,
+    }, sort_keys=True, default=str).encode("utf-8"))
+    h.update(pd.util.hash_pandas_object(spec.data, index=False).to_numpy().tobytes())
+    return h.hexdigest()
+
+def _cache_get(key: str):
+    path = os.path.join(CHART_CACHE_DIR, key + ".img")
+    try:
+        with open(path, "rb") as f:
+            img = f.read()
+    except OSError:
+        return None
+    os.utime(path)  # 更新使用時間，供 LRU 淘汰
+    return img
+
+def _cache_put(key: str, img: bytes):
+    os.makedirs(CHART_CACHE_DIR, exist_ok=True)
+    path = os.path.join(CHART_CACHE_DIR, key + ".img")
+    tmp = path + f".{os.getpid()}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(img)
+    os.replace(tmp, path)
+
+def _cache_evict(max_bytes: int = None):
+    """總大小超過上限時，從最久沒用到的檔案開始刪除。"""
+    max_bytes = CHART_CACHE_MAX_BYTES if max_bytes is None else max_bytes
+    entries = []
+    with os.scandir(CHART_CACHE_DIR) as it:
+        for e in it:
+            if not e.name.endswith(".tmp"):
+                st = e.stat()
+                entries.append((st.st_mtime, st.st_size, e.path))
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total <= max_bytes:
+            break
+        try:
+            os.remove(path)
+        except OSError:
+            continue
+        total -= size
+
+# ---------------- 平行繪製 ----------------
+
+_pool = None
+_pool_size = 0
+
+def _init_worker():
+    matplotlib.use("Agg")
+
+def _get_pool(max_workers: int) -> ProcessPoolExecutor:
+    # 以設定的 process 數建立一次（不隨這次要畫的張數變動），之後只送出需要重畫的圖
+    global _pool, _pool_size
+    if _pool is None or _pool_size != max_workers:
+        shutdown_pool()
+        _pool = ProcessPoolExecutor(max_workers=max_workers, initializer=_init_worker)
+        _pool_size = max_workers
+    return _pool
+
+def shutdown_pool():
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(cancel_futures=True)
+        _pool = None
+
+atexit.register(shutdown_pool)
+
+def _render_timed(spec: ChartSpec) -> tuple:
+    start = time.perf_counter()
+    img = render_chart(spec)
+    return img, (time.perf_counter() - start) * 1000
+
+def render_charts(specs, max_workers: int = None, use_cache: bool = True, names=None) -> list:
+    """繪製多張圖，回傳與 specs 同順序的圖檔位元組；快取命中的圖不重畫。
+
+    names 為各圖的名稱，用於 chart.<name> 計時紀錄（預設為圖種）。
+    """
+    specs = list(specs)
+    names = list(names) if names is not None else [s.kind for s in specs]
+    keys = [chart_key(s) for s in specs] if use_cache else [None] * len(specs)
+    out = [_cache_get(k) if k else None for k in keys]
+
+    # 同一份報表內相同的圖只畫一次
+    todo = {}
+    for i, (k, img) in enumerate(zip(keys, out)):
+        if img is None:
+            todo.setdefault(k or i, []).append(i)
+        else:
+            add_span(f"chart.{names[i]}", 0, cached=True, bytes=len(img))
+    if not todo:
+        return out
+
+    pending = [specs[idx[0]] for idx in todo.values()]
+    size = max_workers or CHART_WORKERS
+    workers = min(size, len(pending))
+    if workers <= 1:
+        results = [_render_timed(s) for s in pending]
+    else:
+        results = list(_get_pool(size).map(_render_timed, pending))
+
+    for (k, idx), (img, ms) in zip(todo.items(), results):
+        for i in idx:
+            out[i] = img
+        # 在 pool 中量到的是該圖自己的繪製時間；同時繪製時總和會大於實際經過時間
+        add_span(f"chart.{names[idx[0]]}", ms, bytes=len(img), workers=workers)
+        if use_cache:
+            _cache_put(k, img)
+    if use_cache:
+        _cache_evict()
+    return out
@@ -0,0 +1,192 @@
+# src/config.py
+"""config/config.json：有型別、經過驗證的設定，以及只在內容變更時才寫入的儲存。
+
+load_config(path) 解析並驗證 JSON，回傳 Config；檔案未變（mtime、大小相同）時不重新解析。
+save_config(path, config) 先寫暫存檔並 fsync，再以 os.replace 取代原檔，當機時不會留下寫到一半的設定。
+
+GUI 透過 ConfigStore 修改設定：改完呼叫 mark_dirty()，由呼叫端的計時器（debounce）稍後呼叫
+flush()；flush 只在內容與上次讀寫時不同才寫檔，取消的對話框、單純重新整理畫面都不會寫入。
+未知的欄位原樣保留，寫回時不會遺失。
+"""
+import os
+import copy
+import json
+import shutil
+from dataclasses import dataclass, field, fields
+from datetime import datetime
+
+from src.scheduler import CATCH_UP_POLICIES
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+CONFIG_PATH = os.path.join(ROOT, "config", "config.json")
+
+ONCE_FORMAT = "%Y-%m-%d %H:%M"   # {"mode": "once", "datetime": "2025-02-14 09:00"}
+WEEKLY_FORMAT = "%H:%M"          # {"mode": "weekly", "weekdays": [1, 3], "time": "09:00"}
+
+@dataclass
+class Config:
+    monitored_files: list = field(default_factory=list)
+    schedules: list = field(default_factory=list)
+    report_sets: list = field(default_factory=list)    # 見 src/report_sets.py
+    catch_up: str = "once"                             # 見 src/scheduler.py
+    max_concurrent_jobs: int = None
+    span_log: str = None
+    profile_slow_s: float = None
+    log_file: str = None
+    log_max_lines: int = None
+    log_max_bytes: int = None
+    log_backups: int = None
+    extra: dict = field(default_factory=dict)          # 未知的欄位，原樣寫回
+
+    def to_dict(self) -> dict:
+        """寫回 JSON 的內容：monitored_files / schedules 一律寫出，其餘只寫出有設定的欄位。"""
+        out = {}
+        for f in fields(self):
+            value = getattr(self, f.name)
+            if f.name == "extra":
+                continue
+            if f.name in ("monitored_files", "schedules") or value not in (None, [], f.default):
+                out[f.name] = value
+        out.update(self.extra)
+        return out
+
+# ---------------- 驗證 ----------------
+
+def _expect(where: str, value, types, what: str):
+    # bool 是 int 的子類別，需另外排除（沒有任何欄位接受 true / false）
+    if isinstance(value, bool) or not isinstance(value, types):
+        raise ValueError(f"config {where}: expected {what}, got {value!r}")
+    return value
+
+def validate_schedule(s, where: str = "schedule") -> dict:
+    """檢查一筆排程並回傳標準化的內容（weekdays 去重排序）。"""
+    _expect(where, s, dict, "an object")
+    mode = s.get("mode")
+    try:
+        if mode == "once":
+            datetime.strptime(_expect(f"{where}.datetime", s.get("datetime"), str, "'YYYY-MM-DD HH:MM'"), ONCE_FORMAT)
+            return {"mode": "once", "datetime": s["datetime"]}
+        if mode == "weekly":
+            wds = _expect(f"{where}.weekdays", s.get("weekdays"), list, "a list of weekdays 1-7")
+            if not wds or any(isinstance(w, bool) or not isinstance(w, int) or not 1 <= w <= 7 for w in wds):
+                raise ValueError(f"config {where}.weekdays: expected a list of weekdays 1-7, got {wds!r}")
+            datetime.strptime(_expect(f"{where}.time", s.get("time"), str, "'HH:MM'"), WEEKLY_FORMAT)
+            return {"mode": "weekly", "weekdays": sorted(set(wds)), "time": s["time"]}
+    except ValueError as e:
+        if str(e).startswith("config "):
+            raise
+        raise ValueError(f"config {where}: {e}") from None
+    raise ValueError(f"config {where}.mode: expected 'once' or 'weekly', got {mode!r}")
+
+def parse_config(data) -> Config:
+    """把 json.load 的結果轉成 Config；型別或內容不符時 ValueError（訊息含欄位位置）。"""
+    _expect("root", data, dict, "an object")
+    known = {f.name for f in fields(Config)} - {"extra"}
+    cfg = Config(extra={k: v for k, v in data.items() if k not in known})
+
+    files = _expect("monitored_files", data.get("monitored_files", []), list, "a list of paths")
+    for i, p in enumerate(files):
+        _expect(f"monitored_files[{i}]", p, str, "a path")
+    cfg.monitored_files = list(files)
+
+    schedules = data.get("schedules") or []  # 舊版 GUI 的預設值為 {}
+    _expect("schedules", schedules, list, "a list")
+    cfg.schedules = [validate_schedule(s, f"schedules[{i}]") for i, s in enumerate(schedules)]
+
+    sets = _expect("report_sets", data.get("report_sets") or [], list, "a list")
+    for i, rs in enumerate(sets):
+        _expect(f"report_sets[{i}]", rs, dict, "an object")
+    cfg.report_sets = sets
+
+    cfg.catch_up = data.get("catch_up", "once")
+    if cfg.catch_up not in CATCH_UP_POLICIES:
+        raise ValueError(f"config catch_up: expected one of {CATCH_UP_POLICIES}, got {cfg.catch_up!r}")
+
+    for name in ("max_concurrent_jobs", "log_max_lines", "log_max_bytes", "log_backups"):
+        value = data.get(name)
+        if value is not None and (_expect(name, value, int, "a positive integer") < 1):
+            raise ValueError(f"config {name}: expected a positive integer, got {value!r}")
+        setattr(cfg, name, value)
+    for name in ("span_log", "log_file"):
+        value = data.get(name)
+        setattr(cfg, name, value if value is None else _expect(name, value, str, "a path"))
+    value = data.get("profile_slow_s")
+    cfg.profile_slow_s = value if value is None else _expect("profile_slow_s", value, (int, float), "seconds")
+    return cfg
+
+# ---------------- 讀寫 ----------------
+
+# 絕對路徑 -> (mtime_ns, 大小, Config)
+_cache = {}
+
+def load_config(path: str = CONFIG_PATH) -> Config:
+    """讀取並驗證設定檔；檔案不存在時 FileNotFoundError，內容有誤時 ValueError。"""
+    key = os.path.abspath(path)
+    st = os.stat(key)
+    hit = _cache.get(key)
+    if hit is None or hit[:2] != (st.st_mtime_ns, st.st_size):
+        with open(key, "r", encoding="utf-8") as f:
+            data = json.load(f)  # JSONDecodeError 是 ValueError
+        hit = (st.st_mtime_ns, st.st_size, parse_config(data))
+        _cache[key] = hit
+    return copy.deepcopy(hit[2])  # 呼叫端可以自由修改
+
+def save_config(path: str, config: Config):
+    """原子寫入：暫存檔 + fsync + os.replace。"""
+    key = os.path.abspath(path)
+    os.makedirs(os.path.dirname(key), exist_ok=True)
+    tmp = f"{key}.{os.getpid()}.tmp"
+    try:
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(config.to_dict(), f, ensure_ascii=False, indent=4)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, key)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+    st = os.stat(key)
+    _cache[key] = (st.st_mtime_ns, st.st_size, copy.deepcopy(config))
+
+class ConfigStore:
+    """GUI 用：持有目前的 Config，記錄是否有未寫入的變更。"""
+
+    def __init__(self, path: str = CONFIG_PATH):
+        self.path = path
+        self.config = Config()
+        self.dirty = False
+        self._saved = None    # 上次讀寫時的內容，用來略過沒有實際變更的寫入
+        self._broken = False  # 讀取失敗的設定檔，第一次覆寫前先備份
+
+    def load(self) -> Config:
+        """讀取設定檔；失敗時改用預設值並把例外往外拋（呼叫端決定如何顯示）。"""
+        self.dirty = False
+        try:
+            self.config = load_config(self.path)
+        except ValueError:
+            self.config, self._saved, self._broken = Config(), None, True
+            raise
+        except FileNotFoundError:
+            self.config, self._saved = Config(), None
+            raise
+        self._saved, self._broken = copy.deepcopy(self.config.to_dict()), False
+        return self.config
+
+    def mark_dirty(self):
+        self.dirty = True
+
+    def flush(self) -> bool:
+        """有未寫入且實際不同的變更才寫檔；回傳是否寫入。"""
+        if not self.dirty:
+            return False
+        self.dirty = False
+        data = self.config.to_dict()
+        if data == self._saved:
+            return False
+        if self._broken and os.path.exists(self.path):
+            shutil.copy2(self.path, self.path + ".bad")  # 保留無法解析的原檔
+            self._broken = False
+        save_config(self.path, self.config)
+        self._saved = copy.deepcopy(data)
+        return True
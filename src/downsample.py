@@ -0,0 +1,79 @@
+# src/downsample.py
+"""長時間序列的降採樣。
+
+折線圖的寬度只有數百個像素，資料點多於像素時畫再多點也看不出差別，
+只會拖慢繪圖與放大 SVG。這裡提供兩種以像素寬度為目標的降採樣：
+
+minmax：每個區間保留最小與最大值，峰值一定會留下。
+lttb：Largest-Triangle-Three-Buckets，保留視覺形狀最重要的點。
+
+以及週 / 月的重新取樣（加總）。
+"""
+import numpy as np
+import pandas as pd
+
+# resample 名稱 -> pandas 頻率；以期間起始日標示
+RESAMPLE_RULES = {
+    "weekly": "W-MON",
+    "monthly": "MS",
+}
+
+def resample_totals(daily: pd.DataFrame, rule: str, date_col: str = "sale_date") -> pd.DataFrame:
+    """把每日金額加總成週 / 月。"""
+    out = (daily.set_index(date_col)["total"]
+                .resample(RESAMPLE_RULES[rule], label="left", closed="left").sum())
+    return out.rename_axis(date_col).reset_index()
+
+def _bucket_edges(n: int, buckets: int) -> np.ndarray:
+    return np.linspace(0, n, buckets + 1).astype(np.int64)
+
+def minmax_indices(y: np.ndarray, buckets: int) -> np.ndarray:
+    """每個區間取最小與最大值的位置（依原順序），頭尾一律保留。"""
+    n = len(y)
+    if buckets * 2 >= n:
+        return np.arange(n)
+    edges = _bucket_edges(n, buckets)
+    keep = [0, n - 1]
+    for lo, hi in zip(edges[:-1], edges[1:]):
+        seg = y[lo:hi]
+        keep.append(lo + int(np.argmin(seg)))
+        keep.append(lo + int(np.argmax(seg)))
+    return np.unique(keep)
+
+def lttb_indices(x: np.ndarray, y: np.ndarray, threshold: int) -> np.ndarray:
+    """Largest-Triangle-Three-Buckets，回傳保留點的位置（含頭尾）。"""
+    n = len(y)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+
+    x = x.astype(np.float64)
+    y = y.astype(np.float64)
+    # 頭尾各自成一桶，中間分成 threshold - 2 桶
+    edges = 1 + _bucket_edges(n - 2, threshold - 2)
+    keep = np.empty(threshold, dtype=np.int64)
+    keep[0] = a = 0
+    for i in range(threshold - 2):
+        lo, hi = edges[i], edges[i + 1]
+        # 下一桶的平均點（最後一桶則用最後一點）
+        nlo, nhi = (edges[i + 1], edges[i + 2]) if i + 2 < len(edges) else (n - 1, n)
+        avg_x, avg_y = x[nlo:nhi].mean(), y[nlo:nhi].mean()
+        area = np.abs((x[a] - avg_x) * (y[lo:hi] - y[a]) - (x[a] - x[lo:hi]) * (avg_y - y[a]))
+        a = lo + int(np.argmax(area))
+        keep[i + 1] = a
+    keep[-1] = n - 1
+    return keep
+
+def downsample(daily: pd.DataFrame, width_px: int, method: str = "minmax",
+               date_col: str = "sale_date") -> pd.DataFrame:
+    """資料點多於 width_px 時降採樣到約 width_px 個點；method 為 "minmax"、"lttb" 或 None。"""
+    if not method or len(daily) <= width_px:
+        return daily
+    y = daily["total"].to_numpy()
+    if method == "minmax":
+        idx = minmax_indices(y, max(1, width_px // 2))
+    elif method == "lttb":
+        x = daily[date_col].to_numpy().astype("datetime64[ns]").astype(np.int64)
+        idx = lttb_indices(x, y, width_px)
+    else:
+        raise ValueError(f"Unknown downsample method: {method!r}")
+    return daily.iloc[idx].reset_index(drop=True)
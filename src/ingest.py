@@ -0,0 +1,286 @@
+# src/ingest.py
+"""監控檔案的讀取與欄式快取。
+
+第一次讀取 CSV 時依 SCHEMAS 指定型別解析，之後把每個欄位存成 .npy（數值直接存，
+類別欄存 codes + categories），下次以 memory-map 載入，不必重新 parse。
+
+Excel 活頁簿（.xlsx / .xlsm / .xls）以「路徑#工作表」指定工作表，例如
+"D:/drop/taipei.xlsx#sales"；未指定時使用與表名相同的工作表，沒有則用第一張。
+只解析需要的那一張工作表與 COLUMNS 列出的欄位；有安裝 python-calamine 時以 calamine
+讀取（比 openpyxl 快數倍），否則用 openpyxl 的唯讀模式。
+
+快取以「路徑」為單位（Excel 為每張工作表）：每個來源有自己的資料夾與 meta.json，內容記錄
+mtime、大小與內容雜湊。mtime/大小相同直接命中；不同時再比對雜湊（只是 touch 過的檔案仍可命中），
+只有內容真的改變才重新解析，而且只影響該來源自己的快取。每個版本的欄位先寫到暫存資料夾再整個改名，
+meta.json 也以暫存檔取代，多個 process 同時讀取同一個來源時不會讀到寫到一半的快取。
+"""
+import os
+import json
+import importlib.util
+import shutil
+import hashlib
+import threading
+import numpy as np
+import pandas as pd
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+CACHE_DIR = os.path.join(ROOT, "cache", "ingest")
+
+# 快取格式變更時遞增，舊快取會自動失效（2：client_id 改為 float64；3：sale_id 改為類別）
+CACHE_VERSION = 3
+
+# 各表的明確型別；未列出的欄位交由 pandas 推斷
+SCHEMAS = {
+    "sales": {
+        "sale_id": "category",   # 固定為字串：逐塊解析時各塊才不會各自推斷成 int 或 str
+        "client_id": "float64",  # 允許空白（NaN），彙總時與原本的 merge 一樣略過
+        "product_code": "category",
+        "amount": "float64",
+        "sale_date": "datetime64[ns]",
+    },
+    "sales_info": {
+        "product_code": "category",
+        "product_name": "category",
+        "category": "category",
+        "price": "float64",
+    },
+    "client": {
+        "client_id": "float64",  # 與 sales 的 client_id 同型別，查表時才對得上
+        "client_name": "category",
+        "region": "category",
+    },
+}
+
+# Excel 只讀取報表用得到的欄位（CSV 仍整份讀取）
+COLUMNS = {
+    "sales": ["sale_id", "client_id", "sale_date", "amount", "product_code"],
+    "sales_info": ["product_code", "product_name", "category", "price"],
+    "client": ["client_id", "client_name", "region"],
+}
+
+EXCEL_EXTS = (".xlsx", ".xlsm", ".xls")
+
+def split_sheet(path: str):
+    """"book.xlsx#sales" -> ("book.xlsx", "sales")；沒有指定工作表時 sheet 為 None。"""
+    file, sep, sheet = path.rpartition("#")
+    if sep and file.lower().endswith(EXCEL_EXTS):
+        return file, sheet or None
+    return path, None
+
+def source_file(path: str) -> str:
+    """實際存在磁碟上的檔案（去掉 #工作表），供 stat 與檔案監看使用。"""
+    return split_sheet(path)[0]
+
+def is_excel(path: str) -> bool:
+    return source_file(path).lower().endswith(EXCEL_EXTS)
+
+def table_kind(path: str) -> str:
+    """sales.csv -> "sales"、book.xlsx#Client -> "client"；用於挑選 SCHEMAS。"""
+    file, sheet = split_sheet(path)
+    return (sheet or os.path.splitext(os.path.basename(file))[0]).lower()
+
+def file_digest(path: str, chunk_size: int = 1 << 20) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+def csv_options(kind: str, columns) -> dict:
+    """依 SCHEMAS 產生 pd.read_csv 的 dtype / parse_dates 參數（只取實際存在的欄位）。"""
+    schema = SCHEMAS.get(kind, {})
+    return {
+        "dtype": {c: t for c, t in schema.items() if c in columns and not t.startswith("datetime")},
+        "parse_dates": [c for c, t in schema.items() if c in columns and t.startswith("datetime")],
+    }
+
+def parse_csv(path: str, kind: str = None) -> pd.DataFrame:
+    """依 SCHEMAS 解析 CSV（不經快取）。"""
+    header = pd.read_csv(path, nrows=0).columns
+    return pd.read_csv(path, **csv_options(kind or table_kind(path), header))
+
+# ---------------- Excel ----------------
+
+def excel_engine():
+    """有 python-calamine 就用 calamine，否則交給 pandas 預設（.xlsx 為 openpyxl 唯讀模式）。"""
+    return "calamine" if importlib.util.find_spec("python_calamine") else None
+
+# path -> (mtime_ns, 工作表名稱)
+_sheet_names = {}
+
+def sheet_names(path: str) -> list:
+    """活頁簿的工作表名稱（只讀取活頁簿目錄，不解析儲存格）。"""
+    mtime = os.stat(path).st_mtime_ns
+    hit = _sheet_names.get(path)
+    if hit and hit[0] == mtime:
+        return hit[1]
+    with pd.ExcelFile(path, engine=excel_engine()) as xl:
+        names = list(xl.sheet_names)
+    _sheet_names[path] = (mtime, names)
+    return names
+
+def _match_sheet(names, sheet, kind):
+    if sheet is not None:
+        for name in names:
+            if name.lower() == sheet.lower():
+                return name
+        raise ValueError(f"Worksheet {sheet!r} not found (available: {', '.join(names)})")
+    for name in names:
+        if name.lower() == kind:
+            return name
+    return names[0]
+
+def parse_excel(path: str, kind: str = None) -> pd.DataFrame:
+    """解析活頁簿中的一張工作表（不經快取），型別與 parse_csv 相同。"""
+    file, sheet = split_sheet(path)
+    kind = kind or table_kind(path)
+    wanted = COLUMNS.get(kind)
+    with pd.ExcelFile(file, engine=excel_engine()) as xl:
+        name = _match_sheet(xl.sheet_names, sheet, kind)
+        df = xl.parse(name, usecols=(lambda c: str(c).strip() in wanted) if wanted else None)
+    df.columns = [str(c).strip() for c in df.columns]
+
+    for col, dtype in SCHEMAS.get(kind, {}).items():
+        if col not in df.columns:
+            continue
+        if dtype.startswith("datetime"):
+            df[col] = pd.to_datetime(df[col])
+        elif dtype == "category":
+            # 儲存格可能是數字或文字（例如 A01 / 1001），與 CSV 一樣以字串為類別；空格維持缺值
+            s = df[col]
+            df[col] = s.astype(str).where(s.notna()).astype("category")
+        else:
+            df[col] = df[col].astype(dtype)
+    return df
+
+def parse_table(path: str, kind: str = None) -> pd.DataFrame:
+    return parse_excel(path, kind) if is_excel(path) else parse_csv(path, kind)
+
+# ---------------- 欄式快取 ----------------
+
+def _entry_dir(path: str, cache_dir: str) -> str:
+    key = hashlib.sha1(os.path.abspath(path).encode("utf-8")).hexdigest()
+    return os.path.join(cache_dir, key)
+
+def _read_meta(entry: str):
+    try:
+        with open(os.path.join(entry, "meta.json"), "r", encoding="utf-8") as f:
+            meta = json.load(f)
+    except (OSError, ValueError):
+        return None
+    return meta if meta.get("version") == CACHE_VERSION else None
+
+def _write_meta(entry: str, meta: dict):
+    tmp = os.path.join(entry, f"meta.json.{os.getpid()}.{threading.get_ident()}.tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(meta, f, ensure_ascii=False, indent=2)
+    os.replace(tmp, os.path.join(entry, "meta.json"))
+
+def _save_columns(df: pd.DataFrame, data_dir: str) -> list:
+    cols = []
+    for i, name in enumerate(df.columns):
+        s = df[name]
+        if not isinstance(s.dtype, pd.CategoricalDtype) and s.dtype == object:
+            s = s.astype("category")  # 字串欄一律以類別存，避免 pickle
+        if isinstance(s.dtype, pd.CategoricalDtype):
+            cats = np.asarray(s.cat.categories)
+            if cats.dtype == object:
+                cats = cats.astype(str)
+            np.save(os.path.join(data_dir, f"{i}.npy"), s.cat.codes.to_numpy())
+            np.save(os.path.join(data_dir, f"{i}.cats.npy"), cats)
+            cols.append({"name": str(name), "kind": "category"})
+        else:
+            np.save(os.path.join(data_dir, f"{i}.npy"), s.to_numpy())
+            cols.append({"name": str(name), "kind": "array"})
+    return cols
+
+def _load_columns(data_dir: str, cols: list) -> pd.DataFrame:
+    data = {}
+    for i, col in enumerate(cols):
+        values = np.load(os.path.join(data_dir, f"{i}.npy"), mmap_mode="r")
+        if col["kind"] == "category":
+            cats = np.load(os.path.join(data_dir, f"{i}.cats.npy"))
+            data[col["name"]] = pd.Categorical.from_codes(values, categories=cats)
+        else:
+            data[col["name"]] = values
+    return pd.DataFrame(data)
+
+def _publish_columns(df: pd.DataFrame, entry: str, data: str) -> list:
+    """把欄位寫到暫存資料夾，完成後整個改名成 entry/data；回傳欄位描述。
+
+    多個 process 同時讀取同一個來源時，別人不會 memory-map 到寫到一半的檔案；
+    目標已存在表示別的 process 先寫好了同一份內容，直接沿用。
+    """
+    data_dir = os.path.join(entry, data)
+    cols_path = os.path.join(data_dir, "columns.json")
+    if os.path.isfile(cols_path):
+        with open(cols_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    tmp = os.path.join(entry, f".{data}.{os.getpid()}.{threading.get_ident()}.tmp")
+    os.makedirs(tmp, exist_ok=True)
+    try:
+        cols = _save_columns(df, tmp)
+        with open(os.path.join(tmp, "columns.json"), "w", encoding="utf-8") as f:
+            json.dump(cols, f)
+        os.replace(tmp, data_dir)
+    except OSError:
+        if not os.path.isfile(cols_path):
+            raise
+        with open(cols_path, "r", encoding="utf-8") as f:  # 別的 process 先完成
+            cols = json.load(f)
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+    return cols
+
+def read_table(path: str, kind: str = None, cache_dir: str = CACHE_DIR) -> pd.DataFrame:
+    """讀取監控檔案（CSV 或 活頁簿#工作表）；內容未變時直接從欄式快取載入。
+
+    kind 決定套用的 SCHEMAS；省略時依檔名推斷（taipei_sales_info.csv 這類檔名推斷不到，呼叫端應明確傳入）。
+    """
+    kind = kind or table_kind(path)
+    file = source_file(path)
+    st = os.stat(file)
+    entry = _entry_dir(path, cache_dir)
+    meta = _read_meta(entry)
+    if meta and meta.get("kind") != kind:
+        meta = None  # 以其他 schema 解析過的快取
+
+    try:
+        if meta and meta["mtime_ns"] == st.st_mtime_ns and meta["size"] == st.st_size:
+            return _load_columns(os.path.join(entry, meta["data"]), meta["columns"])
+
+        digest = file_digest(file)
+        if meta and meta["sha256"] == digest:
+            # 只有 mtime 變了（例如被 touch），內容相同，更新 meta 後沿用
+            meta.update(mtime_ns=st.st_mtime_ns, size=st.st_size)
+            _write_meta(entry, meta)
+            return _load_columns(os.path.join(entry, meta["data"]), meta["columns"])
+    except FileNotFoundError:
+        # 讀到 meta 之後，別的 process 已換上新版本並清掉舊資料夾：重新解析
+        digest = file_digest(file)
+
+    df = parse_table(path, kind)
+
+    # 每個內容版本（與 schema）寫到自己的子資料夾：舊版本可能仍被 memory-map 開著（Windows 無法覆寫）
+    data = hashlib.sha1(f"{kind}\0{digest}".encode("utf-8")).hexdigest()[:16]
+    data_dir = os.path.join(entry, data)
+    os.makedirs(entry, exist_ok=True)
+    meta = {
+        "version": CACHE_VERSION,
+        "path": os.path.abspath(file) + path[len(file):],
+        "kind": kind,
+        "mtime_ns": st.st_mtime_ns,
+        "size": st.st_size,
+        "sha256": digest,
+        "data": data,
+        "columns": _publish_columns(df, entry, data),
+    }
+    _write_meta(entry, meta)  # 資料夾完整之後才更新 meta
+
+    for name in os.listdir(entry):
+        # 暫存資料夾（. 開頭）可能是別的 process 正在寫的，不清除
+        if name != data and not name.startswith(".") and os.path.isdir(os.path.join(entry, name)):
+            shutil.rmtree(os.path.join(entry, name), ignore_errors=True)
+
+    return _load_columns(data_dir, meta["columns"])
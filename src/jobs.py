@@ -0,0 +1,112 @@
+# src/jobs.py
+"""報表工作佇列，不依賴 Qt。
+
+- submit：相同 key 的工作若仍在排隊，就合併成同一筆（不重複產生報表）；
+  已在執行中的不合併，因為它可能讀到的是變動前的資料。
+- 同時執行的數量上限為 max_concurrent，其餘排隊，不會因為有工作在跑就被丟掉。
+  相同 key 的工作不會同時執行（會寫到相同的輸出檔與彙總），須等前一筆結束。
+- 每筆工作記錄狀態（queued / running / done / failed）與排隊、執行時間。
+"""
+import time
+import itertools
+from collections import OrderedDict, deque
+from dataclasses import dataclass, field
+
+QUEUED, RUNNING, DONE, FAILED = "queued", "running", "done", "failed"
+
+@dataclass
+class Job:
+    id: int
+    key: str                          # 合併依據：相同 key 代表相同的報表工作
+    payload: dict                     # 送給 worker 的內容
+    label: str = ""                   # 顯示用名稱
+    state: str = QUEUED
+    queued_at: float = field(default_factory=time.time)
+    started_at: float = None
+    finished_at: float = None
+    result: dict = None
+    error: str = None
+    coalesced: int = 0                # 被合併進來的重複請求數
+
+    @property
+    def wait_s(self) -> float:
+        end = self.started_at or (time.time() if self.state == QUEUED else self.finished_at)
+        return (end or self.queued_at) - self.queued_at
+
+    @property
+    def run_s(self):
+        if self.started_at is None:
+            return None
+        return (self.finished_at or time.time()) - self.started_at
+
+    def describe(self) -> str:
+        run = f"{self.run_s:.1f}s" if self.run_s is not None else "-"
+        merged = f" (+{self.coalesced} merged)" if self.coalesced else ""
+        cached = " (cached)" if (self.result or {}).get("cached") else ""
+        return f"#{self.id:<4} {self.state:<8} wait {self.wait_s:5.1f}s  run {run:>6}  {self.label}{merged}{cached}"
+
+class JobQueue:
+    def __init__(self, max_concurrent: int = 1, history: int = 200):
+        self.max_concurrent = max(1, max_concurrent)
+        self._ids = itertools.count(1)
+        self._pending = deque()
+        self._jobs = OrderedDict()      # id -> Job（含已完成的，保留最近 history 筆）
+        self._history = history
+
+    def submit(self, key: str, payload: dict, label: str = ""):
+        """加入工作；回傳 (job, created)。相同 key 仍在排隊時回傳既有工作，created=False。"""
+        for job in self._pending:
+            if job.key == key:
+                job.coalesced += 1
+                return job, False
+        job = Job(next(self._ids), key, payload, label)
+        self._pending.append(job)
+        self._jobs[job.id] = job
+        self._trim()
+        return job, True
+
+    def next_ready(self):
+        """未達同時執行上限時取出下一筆可執行的工作並標為 running；否則回傳 None。"""
+        if not self._pending or self.running_count() >= self.max_concurrent:
+            return None
+        busy = {j.key for j in self._jobs.values() if j.state == RUNNING}
+        job = next((j for j in self._pending if j.key not in busy), None)
+        if job is None:
+            return None
+        self._pending.remove(job)
+        job.state = RUNNING
+        job.started_at = time.time()
+        return job
+
+    def finish(self, job_id: int, ok: bool, result: dict = None, error: str = None):
+        job = self._jobs.get(job_id)
+        if job is None or job.state != RUNNING:
+            return None
+        job.state = DONE if ok else FAILED
+        job.finished_at = time.time()
+        job.result = result
+        job.error = error
+        return job
+
+    def running_count(self) -> int:
+        return sum(1 for j in self._jobs.values() if j.state == RUNNING)
+
+    def pending_count(self) -> int:
+        return len(self._pending)
+
+    def get(self, job_id: int):
+        return self._jobs.get(job_id)
+
+    def jobs(self) -> list:
+        """由新到舊。"""
+        return list(reversed(self._jobs.values()))
+
+    def _trim(self):
+        # 只淘汰已結束的舊工作
+        while len(self._jobs) > self._history:
+            for jid, job in self._jobs.items():
+                if job.state in (DONE, FAILED):
+                    del self._jobs[jid]
+                    break
+            else:
+                return
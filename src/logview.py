@@ -0,0 +1,144 @@
+# src/logview.py
+"""GUI 的操作紀錄區：有上限的環狀緩衝、定時批次更新畫面、輪替的磁碟紀錄，可依工作篩選。
+
+append() 只把訊息放進記憶體，最多每 FLUSH_MS 毫秒以一次 appendPlainText 寫到畫面，
+worker 的大量輸出不會逐筆重繪。緩衝（deque）與畫面（QPlainTextEdit 的 maximumBlockCount）
+都只保留最近 max_lines 筆，長時間常駐在系統匣也不會無限成長；完整紀錄在同一次 flush 時
+附加到磁碟紀錄檔，超過 max_bytes 就輪替成 .1、.2 ...。
+
+每筆紀錄可帶 job id；上方的下拉選單可只顯示某個工作（或只顯示非工作的 App 訊息）。
+"""
+import os
+import logging
+from collections import deque
+from datetime import datetime
+from logging.handlers import RotatingFileHandler
+
+from PySide6.QtWidgets import QWidget, QPlainTextEdit, QComboBox, QLabel, QHBoxLayout, QVBoxLayout
+from PySide6.QtCore import QTimer
+from PySide6.QtGui import QTextCursor
+
+FLUSH_MS = 200                      # 畫面與磁碟的批次更新間隔
+DEFAULT_MAX_LINES = 5000            # 緩衝與畫面保留的筆數，可由 config 的 log_max_lines 覆寫
+DEFAULT_MAX_BYTES = 5 * 1024 * 1024 # 磁碟紀錄檔輪替大小（log_max_bytes）
+DEFAULT_BACKUPS = 3                 # 保留的舊紀錄檔數（log_backups）
+JOB_FILTERS = 50                    # 下拉選單保留的最近工作數
+
+ALL, APP = "all", "app"
+
+class LogView(QWidget):
+    def __init__(self, parent=None, max_lines: int = DEFAULT_MAX_LINES):
+        super().__init__(parent)
+        self.entries = deque(maxlen=max_lines)  # (時間, job id 或 None, 文字)
+        self._pending = []   # 尚未寫到畫面
+        self._unsaved = []   # 尚未寫到磁碟
+        self._handler = None
+        self._filter = ALL
+        self._jobs = []      # 下拉選單中的工作（由舊到新）
+
+        self.text = QPlainTextEdit(self)
+        self.text.setReadOnly(True)
+        self.text.setUndoRedoEnabled(False)
+        self.text.setMaximumBlockCount(max_lines)
+
+        self.filter_box = QComboBox(self)
+        self.filter_box.addItem("All", ALL)
+        self.filter_box.addItem("App", APP)
+        self.filter_box.currentIndexChanged.connect(self._on_filter_changed)
+
+        bar = QHBoxLayout()
+        bar.addWidget(QLabel("Show:", self))
+        bar.addWidget(self.filter_box)
+        bar.addStretch(1)
+        layout = QVBoxLayout(self)
+        layout.setContentsMargins(0, 0, 0, 0)
+        layout.addLayout(bar)
+        layout.addWidget(self.text)
+
+        self._timer = QTimer(self)
+        self._timer.setSingleShot(True)
+        self._timer.setInterval(FLUSH_MS)
+        self._timer.timeout.connect(self.flush)
+
+    def setPlaceholderText(self, text: str):
+        self.text.setPlaceholderText(text)
+
+    def setFont(self, font):
+        self.text.setFont(font)
+
+    def configure(self, max_lines: int = None, path: str = None,
+                  max_bytes: int = DEFAULT_MAX_BYTES, backups: int = DEFAULT_BACKUPS):
+        """套用 config 的設定；path 為磁碟紀錄檔（None 則不寫檔）。"""
+        if max_lines:
+            self.entries = deque(self.entries, maxlen=max_lines)
+            self.text.setMaximumBlockCount(max_lines)
+        if self._handler is not None:
+            self._handler.close()
+            self._handler = None
+        if path:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            self._handler = RotatingFileHandler(path, maxBytes=max_bytes, backupCount=backups,
+                                                encoding="utf-8", delay=True)
+
+    def append(self, text, job: int = None, label: str = None):
+        """加入一筆紀錄（與 QTextEdit.append 相容）；job / label 用於依工作篩選。"""
+        entry = (datetime.now(), job, str(text))
+        self.entries.append(entry)
+        self._pending.append(entry)
+        self._unsaved.append(entry)
+        if job is not None:
+            self._add_job_filter(job, label)
+        if not self._timer.isActive():
+            self._timer.start()
+
+    def flush(self):
+        """把累積的紀錄一次寫到畫面與磁碟。"""
+        pending, self._pending = self._pending, []
+        # 超過畫面上限的部分反正會被捨棄，只送最後 maximumBlockCount 筆
+        lines = [text for _, job, text in pending if self._matches(job)][-self.text.maximumBlockCount():]
+        if lines:
+            self.text.appendPlainText("\n".join(lines))  # 原本在最底下時會自動捲到底
+        self._write_disk()
+
+    def shutdown(self):
+        self._timer.stop()
+        self.flush()
+        if self._handler is not None:
+            self._handler.close()
+            self._handler = None
+
+    def _matches(self, job) -> bool:
+        if self._filter == ALL:
+            return True
+        if self._filter == APP:
+            return job is None
+        return job == self._filter
+
+    def _add_job_filter(self, job: int, label: str = None):
+        # 下拉選單第 2 項之後依序是 self._jobs 中的工作（不用 findData：PySide6 重複呼叫會出錯）
+        if job in self._jobs:
+            if label:
+                self.filter_box.setItemText(2 + self._jobs.index(job), f"Job #{job} ({label})")
+            return
+        self._jobs.append(job)
+        self.filter_box.addItem(f"Job #{job} ({label})" if label else f"Job #{job}", job)
+        while len(self._jobs) > JOB_FILTERS and self.filter_box.currentIndex() != 2:
+            self._jobs.pop(0)  # 最舊的工作
+            self.filter_box.removeItem(2)
+
+    def _on_filter_changed(self):
+        idx = self.filter_box.currentIndex()
+        self._filter = (ALL, APP)[idx] if idx < 2 else self._jobs[idx - 2]
+        self._pending.clear()  # 已在 entries 中，重新繪製時一併顯示
+        self.text.setPlainText("\n".join(text for _, job, text in self.entries if self._matches(job)))
+        self.text.moveCursor(QTextCursor.End)
+
+    def _write_disk(self):
+        unsaved, self._unsaved = self._unsaved, []
+        if self._handler is None or not unsaved:
+            return
+        msg = "\n".join(
+            f"{ts:%Y-%m-%d %H:%M:%S} {'#' + str(job) if job is not None else '-'} {line}"
+            for ts, job, text in unsaved for line in (text.splitlines() or [""]))
+        # 整批一筆 record：RotatingFileHandler 只在批次之間檢查大小與輪替
+        self._handler.handle(logging.makeLogRecord({"msg": msg, "levelno": logging.INFO, "levelname": "INFO"}))
@@ -0,0 +1,136 @@
+# src/manifest.py
+"""報表層級的結果快取：輸入沒變就不重新產生報表。
+
+每個輸出檔名前綴在 output/.manifest/<prefix>.json 記錄最近一次產生的報表：三個輸入檔的
+指紋、模板的雜湊、程式版本（src/*.py 的雜湊）與報表選項。下次執行時若全部相同且上次的 PDF
+還在，就直接沿用：同一天是同一個檔案，跨日則把舊 PDF（與 HTML）以 hard link 連到今天的檔名
+（不支援時複製），不必載入資料、作圖與轉檔。沿用的報表內容（包含 Generated on 時間）與上次相同。
+之後同一天需要重新產生時，先移除共用的連結再寫入，前一天的報表不受影響。
+
+輸入檔指紋以 (大小, mtime) 為主：
+- 大小或路徑不同 → 內容一定不同，不必計算雜湊。
+- 大小相同、mtime 不同（touch、或上游每天重新匯出同樣的資料）→ 計算 sha256 與上次比較，
+  並記錄下來供之後比對。
+"""
+import os
+import glob
+import json
+import shutil
+import hashlib
+from datetime import datetime
+
+from src.ingest import file_digest, source_file
+from src.spans import span
+
+MANIFEST_VERSION = 1
+INPUTS = ("sales", "sales_info", "client")
+
+_code_version = None
+
+def code_version() -> str:
+    """src/*.py 內容的雜湊；程式更新後舊的快取自動失效。"""
+    global _code_version
+    if _code_version is None:
+        h = hashlib.sha256()
+        for path in sorted(glob.glob(os.path.join(os.path.dirname(os.path.abspath(__file__)), "*.py"))):
+            with open(path, "rb") as f:
+                h.update(os.path.basename(path).encode() + b"\0" + f.read())
+        _code_version = h.hexdigest()[:16]
+    return _code_version
+
+def _input_state(path: str, prev: dict):
+    """回傳 (輸入檔的指紋, 是否與 prev 相同)。"""
+    file = source_file(path)
+    st = os.stat(file)
+    cur = {"path": os.path.abspath(file) + path[len(file):], "size": st.st_size, "mtime_ns": st.st_mtime_ns}
+    if not prev or prev.get("path") != cur["path"] or prev.get("size") != cur["size"]:
+        return cur, False
+    if prev.get("mtime_ns") == cur["mtime_ns"]:
+        if prev.get("sha256"):
+            cur["sha256"] = prev["sha256"]
+        return cur, True
+    cur["sha256"] = file_digest(file)
+    return cur, cur["sha256"] == prev.get("sha256")
+
+def _link_or_copy(src: str, dst: str):
+    if os.path.abspath(src) == os.path.abspath(dst):
+        return
+    if os.path.exists(dst):
+        os.remove(dst)
+    try:
+        os.link(src, dst)
+    except OSError:  # 不同磁碟區、FAT 等不支援 hard link
+        shutil.copy2(src, dst)
+
+def _break_link(path: str):
+    """path 是與其他報表共用的 hard link 時先移除，重新產生時才不會改寫到那份報表的內容。"""
+    try:
+        if os.stat(path).st_nlink > 1:
+            os.remove(path)
+    except FileNotFoundError:
+        pass
+
+class BuildManifest:
+    def __init__(self, output_dir: str):
+        self.dir = os.path.join(output_dir, ".manifest")
+
+    def _path(self, prefix: str) -> str:
+        return os.path.join(self.dir, f"{prefix}.json")
+
+    def read(self, prefix: str) -> dict:
+        try:
+            with open(self._path(prefix), "r", encoding="utf-8") as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+        return entry if entry.get("version") == MANIFEST_VERSION else None
+
+    def write(self, prefix: str, entry: dict):
+        os.makedirs(self.dir, exist_ok=True)
+        tmp = f"{self._path(prefix)}.{os.getpid()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"version": MANIFEST_VERSION, **entry}, f, ensure_ascii=False, indent=2)
+        os.replace(tmp, self._path(prefix))
+
+    def fingerprint(self, prefix: str, inputs: dict, template: str, options: dict):
+        """回傳 (這次的紀錄內容, 上次的紀錄或 None, 是否相同)。"""
+        prev = self.read(prefix) or {}
+        same = bool(prev)
+        state = {}
+        for key in INPUTS:
+            state[key], unchanged = _input_state(inputs[key], (prev.get("inputs") or {}).get(key))
+            same = same and unchanged
+        fp = {
+            "inputs": state,
+            "template": file_digest(template),
+            "code": code_version(),
+            "options": json.loads(json.dumps(options, sort_keys=True)),  # 與讀回的 JSON 比較
+        }
+        same = same and all(prev.get(k) == fp[k] for k in ("template", "code", "options"))
+        same = same and bool(prev.get("pdf")) and os.path.isfile(prev["pdf"])
+        return fp, (prev or None), same
+
+def cached_report(manifest: BuildManifest, prefix: str, inputs: dict, template: str, options: dict,
+                  out_pdf: str, build, force: bool = False):
+    """輸入、模板、程式與選項都沒變時沿用上次的 PDF，否則呼叫 build() 產生；回傳 (PDF 路徑, 是否命中)。
+
+    build() 必須回傳 PDF 路徑；out_pdf 為這次應有的輸出檔名（沿用時連結到此）。
+    """
+    with span("manifest") as s:
+        fp, prev, same = manifest.fingerprint(prefix, inputs, template, options)
+        s["cached"] = same and not force
+        if s["cached"]:
+            _link_or_copy(prev["pdf"], out_pdf)
+            html = os.path.splitext(prev["pdf"])[0] + ".html"
+            # --images files 的 HTML 以相對路徑引用 <報表名>_assets/，換檔名後會斷掉，只沿用 PDF
+            if os.path.isfile(html) and not os.path.isdir(os.path.splitext(html)[0] + "_assets"):
+                _link_or_copy(html, os.path.splitext(out_pdf)[0] + ".html")
+            manifest.write(prefix, {**prev, **fp, "pdf": out_pdf})  # 記下新的 sha256 與檔名
+            return out_pdf, True
+
+    # 同一天先沿用（連結到前一天的報表）、輸入變了再重新產生：轉檔與寫 HTML 都會就地覆寫檔案
+    for path in (out_pdf, os.path.splitext(out_pdf)[0] + ".html"):
+        _break_link(path)
+    pdf = build()
+    manifest.write(prefix, {**fp, "pdf": pdf, "built_at": datetime.now().isoformat(timespec="seconds")})
+    return pdf, False
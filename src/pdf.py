@@ -0,0 +1,291 @@
+# src/pdf.py
+"""HTML -> PDF 轉檔後端。
+
+所有後端都實作 PdfConverter：convert(html, pdf) 轉一份，convert_many([(html, pdf), ...]) 批次轉換。
+
+    exe        呼叫 weasyprint.exe（原本的做法，Windows 單檔執行檔）；批次時同時跑多個行程
+    weasyprint 在本行程內以 weasyprint 套件轉檔（延後匯入），字型設定跨報表重用
+    service    常駐的轉檔行程（python -m src.pdf serve），以 stdin/stdout 的 JSON 行溝通，
+               字型與 CSS 快取留在該行程中；批次時最多 max_in_flight 個請求在途，收一個回覆補送一個
+    fake       不排版，只寫出最小的 PDF；在沒有轉檔器的環境（例如 Linux）量測其餘流程用
+    auto       有 weasyprint.exe 就用 exe，否則用已安裝的 weasyprint 套件
+
+後端以 get_converter(name) 取得，同一行程內相同名稱共用一個實例；未指定名稱時讀環境變數
+RAS_PDF_BACKEND（預設 auto）。
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import itertools
+import threading
+import subprocess
+from abc import ABC, abstractmethod
+
+if __package__ in (None, ""):
+    sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+WEASY_EXE = os.path.join(ROOT, "weasyprint.exe")
+
+BACKENDS = ("auto", "exe", "weasyprint", "service", "fake")
+DEFAULT_BACKEND = os.environ.get("RAS_PDF_BACKEND", "auto")
+
+class PdfConverter(ABC):
+    name = ""
+
+    @abstractmethod
+    def convert(self, html_path: str, pdf_path: str) -> str:
+        """把 html_path 轉成 pdf_path，回傳 pdf_path。"""
+
+    def convert_many(self, pairs) -> list:
+        """批次轉換 [(html, pdf), ...]，回傳 PDF 路徑清單；預設逐一轉換。"""
+        return [self.convert(html, pdf) for html, pdf in pairs]
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+class ExeConverter(PdfConverter):
+    """呼叫獨立可執行檔（不需任何系統 DLL），每份報表一個行程。"""
+    name = "exe"
+
+    def __init__(self, exe: str = WEASY_EXE, max_parallel: int = None):
+        if not os.path.isfile(exe):
+            raise FileNotFoundError(f"找不到 weasyprint.exe：{exe}")
+        self.exe = exe
+        self.max_parallel = max_parallel or os.cpu_count() or 1
+
+    def convert(self, html_path, pdf_path):
+        subprocess.run([self.exe, html_path, pdf_path], check=True)
+        return pdf_path
+
+    def convert_many(self, pairs):
+        # 同時最多 max_parallel 個轉檔行程，依序收回
+        pairs = list(pairs)
+        running = []
+        try:
+            for html, pdf in pairs:
+                if len(running) >= self.max_parallel:
+                    self._wait(running.pop(0))
+                running.append(subprocess.Popen([self.exe, html, pdf]))
+            while running:
+                self._wait(running.pop(0))
+        finally:
+            # 中途失敗（啟動失敗、某份轉檔失敗）時，結束並回收已啟動的行程
+            for proc in running:
+                proc.kill()
+                proc.wait()
+        return [pdf for _, pdf in pairs]
+
+    @staticmethod
+    def _wait(proc):
+        if proc.wait() != 0:
+            raise subprocess.CalledProcessError(proc.returncode, proc.args)
+
+class WeasyPrintConverter(PdfConverter):
+    """在本行程內轉檔；FontConfiguration 跨報表重用，字型只掃描一次。"""
+    name = "weasyprint"
+
+    def __init__(self):
+        try:
+            import weasyprint
+            from weasyprint.text.fonts import FontConfiguration
+        except (ImportError, OSError) as e:
+            # OSError：套件已安裝但缺少 Pango 等系統函式庫
+            raise RuntimeError(f"weasyprint backend is unavailable ({e}); see the WeasyPrint installation guide") from e
+        self._weasyprint = weasyprint
+        self._fonts = FontConfiguration()
+
+    def convert(self, html_path, pdf_path):
+        self._weasyprint.HTML(filename=html_path).write_pdf(pdf_path, font_config=self._fonts)
+        return pdf_path
+
+class FakeConverter(PdfConverter):
+    """只讀取 HTML 並寫出一頁空白 PDF，可選擇模擬轉檔時間。"""
+    name = "fake"
+
+    def __init__(self, delay_s: float = 0.0):
+        self.delay_s = delay_s
+
+    def convert(self, html_path, pdf_path):
+        with open(html_path, "rb") as f:
+            size = len(f.read())
+        if self.delay_s:
+            time.sleep(self.delay_s)
+        with open(pdf_path, "wb") as f:
+            f.write(_fake_pdf(os.path.basename(html_path), size))
+        return pdf_path
+
+def _fake_pdf(source: str, size: int) -> bytes:
+    return (
+        b"%PDF-1.4\n"
+        + f"% fake conversion of {source} ({size} bytes)\n".encode("utf-8", "replace")
+        + b"1 0 obj <</Type /Catalog /Pages 2 0 R>> endobj\n"
+          b"2 0 obj <</Type /Pages /Kids [3 0 R] /Count 1>> endobj\n"
+          b"3 0 obj <</Type /Page /Parent 2 0 R /MediaBox [0 0 595 842]>> endobj\n"
+          b"trailer <</Root 1 0 R>>\n%%EOF\n"
+    )
+
+class ServiceConverter(PdfConverter):
+    """常駐轉檔行程的用戶端。
+
+    請求：{"id": 1, "html": "<path>", "pdf": "<path>"}；回覆：{"id": 1, "status": "ok", "pdf": ...}。
+    行程意外結束時，下一次轉檔會重新啟動。
+    """
+    name = "service"
+
+    def __init__(self, backend: str = "weasyprint", command: list = None, max_in_flight: int = 32):
+        self.command = command or [sys.executable, "-m", "src.pdf", "serve", "--backend", backend]
+        # 在途請求的上限：全部先送出時，服務的回覆管線塞滿後雙方會互相等待（deadlock）
+        self.max_in_flight = max(1, max_in_flight)
+        self._proc = None
+        self._ids = 0
+        self._lock = threading.Lock()
+
+    def _ensure(self):
+        if self._proc is not None and self._proc.poll() is None:
+            return
+        self._proc = subprocess.Popen(self.command, cwd=ROOT, stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                                      text=True, encoding="utf-8", bufsize=1)
+        ready = self._read()
+        if ready.get("event") != "ready":
+            raise RuntimeError(f"PDF service failed to start: {ready}")
+
+    def _read(self) -> dict:
+        line = self._proc.stdout.readline()
+        if not line:
+            code = self._proc.wait()
+            self._proc = None
+            raise RuntimeError(f"PDF service exited (code={code})")
+        return json.loads(line)
+
+    def convert(self, html_path, pdf_path):
+        return self.convert_many([(html_path, pdf_path)])[0]
+
+    def convert_many(self, pairs):
+        pairs = list(pairs)
+        with self._lock:
+            self._ensure()
+            # 保持最多 max_in_flight 個請求在途，省去每份報表一次往返，管線也不會塞滿
+            first = self._ids + 1
+            pending = iter(pairs)
+            in_flight = self._send(pending, self.max_in_flight)
+
+            errors = []
+            while in_flight:
+                reply = self._read()
+                if reply.get("status") != "ok":
+                    errors.append(f"#{reply.get('id', 0) - first + 1}: {reply.get('error')}")
+                in_flight += self._send(pending, 1) - 1
+        if errors:
+            raise RuntimeError("PDF service failed: " + "; ".join(errors))
+        return [pdf for _, pdf in pairs]
+
+    def _send(self, pairs, limit: int) -> int:
+        """從 pairs 送出最多 limit 個請求，回傳送出的數量。"""
+        sent = 0
+        for html, pdf in itertools.islice(pairs, limit):
+            self._ids += 1
+            self._proc.stdin.write(json.dumps({"id": self._ids, "html": html, "pdf": pdf}, ensure_ascii=False) + "\n")
+            sent += 1
+        if sent:
+            self._proc.stdin.flush()
+        return sent
+
+    def close(self):
+        with self._lock:
+            if self._proc is None:
+                return
+            self._proc.stdin.close()  # stdin EOF -> 服務正常結束
+            try:
+                self._proc.wait(3)
+            except subprocess.TimeoutExpired:
+                self._proc.kill()
+            self._proc = None
+
+def make_converter(name: str = None, **kwargs) -> PdfConverter:
+    """建立新的轉檔後端；kwargs 傳給該後端的建構式。"""
+    name = name or DEFAULT_BACKEND
+    if name == "auto":
+        if os.path.isfile(kwargs.get("exe", WEASY_EXE)):
+            return ExeConverter(**kwargs)
+        try:
+            return WeasyPrintConverter()
+        except RuntimeError:
+            raise FileNotFoundError(f"找不到 weasyprint.exe（{WEASY_EXE}），也無法使用 weasyprint 套件") from None
+    if name == "exe":
+        return ExeConverter(**kwargs)
+    if name == "weasyprint":
+        return WeasyPrintConverter(**kwargs)
+    if name == "service":
+        return ServiceConverter(**kwargs)
+    if name == "fake":
+        return FakeConverter(**kwargs)
+    raise ValueError(f"Unknown PDF backend: {name!r} (expected one of {BACKENDS})")
+
+# name -> 已建立的後端（同一行程重複使用，常駐 worker 因此保有字型快取與轉檔服務）
+_converters = {}
+
+def get_converter(name: str = None) -> PdfConverter:
+    name = name or DEFAULT_BACKEND
+    if name not in _converters:
+        _converters[name] = make_converter(name)
+    return _converters[name]
+
+def close_converters():
+    for conv in _converters.values():
+        conv.close()
+    _converters.clear()
+
+def serve(backend: str = "weasyprint"):
+    """轉檔服務主迴圈：stdin 每行一個請求，stdout 每行一個回覆。"""
+    conv = make_converter(backend)
+    out = sys.stdout
+    out.write(json.dumps({"event": "ready", "pid": os.getpid(), "backend": conv.name}) + "\n")
+    out.flush()
+    for line in sys.stdin:
+        line = line.strip()
+        if not line:
+            continue
+        start = time.perf_counter()
+        req = None
+        try:
+            req = json.loads(line)
+            conv.convert(req["html"], req["pdf"])
+            reply = {"id": req.get("id"), "status": "ok", "pdf": req["pdf"]}
+        except Exception as e:
+            reply = {"id": req.get("id") if isinstance(req, dict) else None,
+                     "status": "error", "error": f"{type(e).__name__}: {e}"}
+        reply["elapsed"] = round(time.perf_counter() - start, 3)
+        out.write(json.dumps(reply, ensure_ascii=False) + "\n")
+        out.flush()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="HTML to PDF conversion")
+    sub = parser.add_subparsers(dest="command", required=True)
+    p = sub.add_parser("serve", help="Run a long-lived converter speaking JSON lines on stdin/stdout")
+    p.add_argument("--backend", choices=["weasyprint", "exe", "fake"], default="weasyprint")
+    p = sub.add_parser("convert", help="Convert HTML files to PDF files next to them")
+    p.add_argument("html", nargs="+")
+    p.add_argument("--backend", choices=BACKENDS, default=None)
+    args = parser.parse_args(argv)
+
+    if args.command == "serve":
+        serve(args.backend)
+        return
+    with make_converter(args.backend) as conv:
+        start = time.perf_counter()
+        pdfs = conv.convert_many([(h, os.path.splitext(h)[0] + ".pdf") for h in args.html])
+        for pdf in pdfs:
+            print("OK ->", pdf)
+        print(f"{len(pdfs)} file(s) in {time.perf_counter() - start:.2f}s with {conv.name}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,180 @@
+# src/report_sets.py
+"""報表組（report set）：每組有自己的 sales / sales_info / client、模板與輸出檔名前綴。
+
+config 中的格式：
+    "report_sets": [
+        {"name": "taipei",
+         "sales": "D:/data/taipei/sales.csv",
+         "sales_info": "D:/data/shared/sales_info.csv",
+         "client": "D:/data/taipei/client.csv",
+         "template": "templates/pdf_templates.md",     # 可省略；相對路徑以專案根目錄為準
+         "output_prefix": "taipei"}                    # 可省略，預設 report_<name>
+    ]
+也可加上 images / chart_formats / trend / pdf_backend，與 task.py 的同名參數相同。
+
+輸入也可以是 Excel 工作表，以「活頁簿#工作表」表示，例如 "D:/drop/taipei.xlsx#sales"（見 src/ingest.py）。
+
+沒有設定 report_sets 時沿用原本的行為：在監控檔案中依檔名找出 sales.csv、sales_info.csv、
+client.csv（或同名的 .xlsx），仍缺的表再到監控的活頁簿中找同名工作表，組成一組 "default"，
+輸出檔名仍是 report_<日期>。
+
+run_report_sets 以 process pool 平行產生多組報表。同一行程內路徑相同的 sales_info / client
+只載入一次（worker 的記憶體快取）；跨行程則共用 ingest 的欄式快取（mmap，作業系統共用頁面）。
+"""
+import os
+import sys
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+
+if __package__ in (None, ""):
+    sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from src.config import CONFIG_PATH, load_config
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+
+# 輸入種類 -> 預設組在監控檔案中使用的檔名（同名的活頁簿，如 sales.xlsx，也算）
+INPUTS = {"sales": "sales.csv", "sales_info": "sales_info.csv", "client": "client.csv"}
+# 可逐組覆寫的報表選項（直接傳給 build_report）
+OPTIONS = ("images", "chart_formats", "trend", "pdf_backend")
+
+def default_set(monitored_files) -> dict:
+    """依檔名從監控檔案中找出三個輸入，組成 "default" 組。"""
+    from src.ingest import EXCEL_EXTS, sheet_names
+
+    found, books = {}, []
+    for p in sorted(monitored_files):
+        name = os.path.basename(p).lower()
+        stem, ext = os.path.splitext(name)
+        if ext in EXCEL_EXTS:
+            books.append(p)
+        for key, fname in INPUTS.items():
+            if name == fname:
+                found[key] = p
+            elif stem == key and ext in EXCEL_EXTS:
+                found.setdefault(key, p)  # 同名的 CSV 優先
+    for book in books:
+        if len(found) == len(INPUTS):
+            break
+        try:
+            sheets = {n.lower() for n in sheet_names(book)}
+        except Exception:
+            continue  # 無法開啟的活頁簿（缺少讀取引擎、檔案損毀）略過，照常回報缺少的表
+        for key in INPUTS:
+            if key not in found and key in sheets:
+                found[key] = f"{book}#{key}"
+    missing = [fname for key, fname in INPUTS.items() if key not in found]
+    if missing:
+        raise FileNotFoundError(f"❌ 以下檔案未在 monitored_set 中找到: {', '.join(missing)}")
+    return {"name": "default", **found, "template": None, "output_prefix": "report"}
+
+def normalize_set(rs: dict, index: int = 0) -> dict:
+    """補上預設值並檢查必要欄位。"""
+    name = str(rs.get("name") or f"set{index + 1}")
+    missing = [key for key in INPUTS if not rs.get(key)]
+    if missing:
+        raise ValueError(f"Report set {name!r} is missing: {', '.join(missing)}")
+    template = rs.get("template")  # None：build_report 使用預設模板
+    if template and not os.path.isabs(template):
+        template = os.path.join(ROOT, template)
+    out = {
+        "name": name,
+        **{key: rs[key] for key in INPUTS},
+        "template": template,
+        "output_prefix": rs.get("output_prefix") or f"report_{name}",
+    }
+    out.update({k: rs[k] for k in OPTIONS if rs.get(k) is not None})
+    return out
+
+def resolve_report_sets(config: dict, monitored_files=()) -> list:
+    """config 的 report_sets；未設定時以監控檔案組成單一預設組。"""
+    raw = config.get("report_sets") or []
+    if not raw:
+        return [default_set(monitored_files)]
+
+    sets = [normalize_set(rs, i) for i, rs in enumerate(raw)]
+    for field in ("name", "output_prefix"):
+        seen = set()
+        for rs in sets:
+            if rs[field] in seen:
+                raise ValueError(f"Duplicate report set {field}: {rs[field]!r}")
+            seen.add(rs[field])
+    return sets
+
+def input_paths(sets) -> list:
+    """所有組用到的輸入檔（去重，活頁簿去掉 #工作表），供檔案監看使用。"""
+    from src.ingest import source_file
+    return sorted({source_file(rs[key]) for rs in sets for key in INPUTS})
+
+def sets_for_paths(sets, paths) -> list:
+    """只保留輸入檔中有任何一個在 paths 裡的組。"""
+    from src.ingest import source_file
+    changed = {os.path.normcase(os.path.abspath(p)) for p in paths}
+    return [rs for rs in sets
+            if any(os.path.normcase(os.path.abspath(source_file(rs[key]))) in changed for key in INPUTS)]
+
+def chart_workers_per_process(processes: int) -> int:
+    """多個報表行程同時執行時平分 CPU，避免每個行程再各自開滿繪圖 pool。"""
+    return max(1, (os.cpu_count() or 1) // max(1, processes))
+
+def init_process(chart_workers: int):
+    """報表 process pool 的 initializer：限制繪圖 process 數並預先初始化字型快取。"""
+    from src import charts, worker
+    charts.CHART_WORKERS = chart_workers
+    worker._warm_up()
+
+def run_one(job: dict) -> dict:
+    """在 pool 行程中產生一份報表（worker 延後匯入，主行程不必載入 pandas / matplotlib）。"""
+    from src.worker import run_job
+    return run_job(job)
+
+def run_report_sets(sets, max_workers: int = None, **options) -> list:
+    """平行產生各組報表，回傳與 sets 同順序的結果（格式同 worker 的回覆）。
+
+    options（例如 full=True、images="files"）套用到每一組，但組內自己的設定優先。
+    """
+    jobs = [{"id": rs["name"], **options, **rs} for rs in sets]
+    if not jobs:
+        return []
+    workers = min(max_workers or os.cpu_count() or 1, len(jobs))
+    if workers <= 1:
+        return [run_one(job) for job in jobs]
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_process,
+                             initargs=(chart_workers_per_process(workers),)) as pool:
+        return list(pool.map(run_one, jobs))
+
+def read_config(path: str = CONFIG_PATH) -> dict:
+    """經 src.config 驗證後的設定（dict）；檔案未變時不重新解析。"""
+    return load_config(path).to_dict()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build every report set in config.json in parallel")
+    parser.add_argument("--config", default=CONFIG_PATH, help="Path to config.json")
+    parser.add_argument("--set", action="append", default=[], dest="names", metavar="NAME",
+                        help="Only build these report sets (repeatable)")
+    parser.add_argument("--workers", type=int, help="Number of report processes (default: CPU count)")
+    parser.add_argument("--full", action="store_true",
+                        help="Ignore stored aggregates and the report cache; rebuild from the first row "
+                             "(needed after editing rows in the middle of the sales file)")
+    args = parser.parse_args(argv)
+
+    config = read_config(args.config)
+    sets = resolve_report_sets(config, config.get("monitored_files", []))
+    if args.names:
+        unknown = set(args.names) - {rs["name"] for rs in sets}
+        if unknown:
+            parser.error(f"unknown report set(s): {', '.join(sorted(unknown))}")
+        sets = [rs for rs in sets if rs["name"] in args.names]
+
+    failed = 0
+    for res in run_report_sets(sets, args.workers, full=args.full):
+        if res["status"] == "ok":
+            cached = ", cached" if res.get("cached") else ""
+            print(f"OK   [{res['id']}] -> {res['output']} ({res['elapsed']:.2f}s{cached})")
+        else:
+            failed += 1
+            print(f"FAIL [{res['id']}] {res['error']} ({res['elapsed']:.2f}s)")
+    sys.exit(1 if failed else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+# src/scheduler.py
+"""排程計算：以 min-heap 找出下一個觸發時刻，不依賴 Qt。
+
+config 中的排程格式：
+    {"mode": "weekly", "weekdays": [1, 3], "time": "09:00"}   # 1=週一 ... 7=週日
+    {"mode": "once", "datetime": "2025-02-14 09:00"}
+
+每筆排程只在建立時解析一次，heap 內放 (下次觸發時間, 序號, 排程)。呼叫端只需在
+next_fire_time() 那一刻醒來呼叫 pop_due(now)，排程數量再多，閒置時也沒有成本。
+
+排程變更時呼叫端會重建 Scheduler；把同一個 fired dict 傳給新實例，剛觸發過的排程在同一分鐘內
+不會因重建而再觸發一次。
+
+錯過的觸發（例如電腦睡眠，醒來時已超過 grace）依 catch_up 處理：
+    "once"：錯過幾次都只補跑一次（預設）
+    "all" ：每個錯過的時刻各補跑一次
+    "skip"：不補跑，直接排到下一次
+"""
+import heapq
+import itertools
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+
+CATCH_UP_POLICIES = ("once", "all", "skip")
+
+@dataclass
+class Fire:
+    schedule: dict     # config 中的原始排程
+    at: datetime       # 預定觸發時間
+    missed: bool       # 是否晚於 grace（錯過的觸發）
+    skipped: bool = False  # 依 catch_up="skip" 不執行；once 排程仍視為已消耗
+
+def _parse_once(s: dict):
+    try:
+        return datetime.strptime(s.get("datetime") or "", "%Y-%m-%d %H:%M")
+    except (TypeError, ValueError):
+        return None
+
+def _parse_weekly(s: dict):
+    wds = s.get("weekdays")
+    try:
+        hh, mm = map(int, (s.get("time") or "").split(":"))
+        days = sorted({int(w) for w in wds if 1 <= int(w) <= 7}) if isinstance(wds, list) else []
+    except (TypeError, ValueError):
+        return None
+    return (days, hh, mm) if days else None
+
+def _fired_key(s: dict, spec) -> tuple:
+    # 以排程內容而非物件識別：重新讀取 config 後排程是新的 dict
+    return ("weekly", tuple(spec[0]), spec[1], spec[2]) if s.get("mode") == "weekly" else ("once", spec)
+
+def next_weekly(weekdays, hh: int, mm: int, after: datetime) -> datetime:
+    """weekdays 中嚴格晚於 after 的第一個 hh:mm。"""
+    base = after.replace(hour=hh, minute=mm, second=0, microsecond=0)
+    for diff in range(8):
+        cand = base + timedelta(days=diff)
+        if cand.isoweekday() in weekdays and cand > after:
+            return cand
+    raise AssertionError("unreachable: a weekday always matches within 8 days")
+
+class Scheduler:
+    def __init__(self, schedules, catch_up: str = "once", grace: timedelta = timedelta(minutes=1),
+                 now: datetime = None, fired: dict = None):
+        if catch_up not in CATCH_UP_POLICIES:
+            raise ValueError(f"Unknown catch-up policy: {catch_up!r}")
+        self.catch_up = catch_up
+        self.grace = grace
+        self._heap = []
+        self._seq = itertools.count()
+        self._weekly = {}   # id(schedule) -> (weekdays, hh, mm)
+        self._keys = {}     # id(schedule) -> _fired_key
+        # _fired_key -> 最近一次觸發的時間；重建時傳入同一個 dict，新舊實例共用
+        self.fired = fired if fired is not None else {}
+        now = now or datetime.now()
+
+        for s in schedules:
+            if s.get("mode") == "weekly":
+                spec = _parse_weekly(s)
+                if spec is None:
+                    continue  # 異常資料，跳過但保留在 config
+                self._weekly[id(s)] = spec
+                key = self._keys[id(s)] = _fired_key(s, spec)
+                # 從一分鐘前開始找，讓「正好是現在這一分鐘」的排程仍會觸發；已觸發過的則從該次之後找
+                after = now - timedelta(minutes=1)
+                if key in self.fired:
+                    after = max(after, self.fired[key])
+                self._push(next_weekly(*spec, after), s)
+            else:
+                at = _parse_once(s)
+                if at is not None and _fired_key(s, at) not in self.fired:
+                    self._keys[id(s)] = _fired_key(s, at)
+                    self._push(at, s)
+
+    def __len__(self):
+        return len(self._heap)
+
+    def _push(self, at: datetime, s: dict):
+        heapq.heappush(self._heap, (at, next(self._seq), s))
+
+    def next_fire_time(self):
+        return self._heap[0][0] if self._heap else None
+
+    def pop_due(self, now: datetime = None) -> list:
+        """取出所有 <= now 的觸發；weekly 重新排入下一次，once 取出後即移除。
+
+        被 skip 的觸發也會回傳（skipped=True），讓呼叫端能把已過期的 once 從 config 移除。
+        """
+        now = now or datetime.now()
+        fires = []
+        while self._heap and self._heap[0][0] <= now:
+            at, _, s = heapq.heappop(self._heap)
+            missed = now - at > self.grace
+            fires.append(Fire(s, at, missed, skipped=missed and self.catch_up == "skip"))
+            self.fired[self._keys[id(s)]] = at
+
+            spec = self._weekly.get(id(s))
+            if spec is None:
+                continue  # once
+            if self.catch_up == "all":
+                nxt = next_weekly(*spec, at)          # 逐次補跑：錯過的下一次會在這個迴圈再被取出
+            else:
+                nxt = next_weekly(*spec, max(at, now))  # 錯過多次也只觸發這一次
+            self._push(nxt, s)
+        return fires
@@ -0,0 +1,190 @@
+# src/spans.py
+"""報表各階段的計時紀錄（span）與選用的效能剖析。
+
+    with recording() as rec:              # 一次報表一個 recorder
+        with span("load.client") as s:    # 任何深度的函式都可直接呼叫，不必傳遞 recorder
+            df = read_table(path)
+            s["rows"] = len(df)
+    rec.spans  # [{"span": "load.client", "rows": 5, "at_ms": 0.1, "ms": 3.2, "peak_rss_kib": 81234}, ...]
+
+沒有進行中的 recorder 時 span 不做任何紀錄，CLI 以外的呼叫端不受影響。
+每筆 span 是一個 dict，可寫成 JSON 行（JsonLinesSink），GUI 則以 format_breakdown 顯示。
+peak_rss_kib 為行程啟動以來的最高常駐記憶體（常駐 worker 中只增不減）。
+
+profiled(...) 以 cProfile 與 tracemalloc 包住一次報表，只有超過門檻的慢報表才寫出
+.prof 與記憶體配置排行；在 process pool 中繪製的圖不在剖析範圍內。
+"""
+import os
+import sys
+import json
+import time
+import pstats
+import cProfile
+import threading
+import contextvars
+import tracemalloc
+from contextlib import contextmanager
+from datetime import datetime
+
+_current = contextvars.ContextVar("ras_span_recorder", default=None)
+
+def peak_rss_kib():
+    """行程的最高常駐記憶體（KiB）；無法取得時回傳 None。"""
+    if sys.platform == "win32":
+        return _peak_rss_windows()
+    try:
+        import resource
+    except ImportError:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss // 1024 if sys.platform == "darwin" else rss  # macOS 單位為 bytes
+
+def _peak_rss_windows():
+    import ctypes
+    from ctypes import wintypes
+
+    class PROCESS_MEMORY_COUNTERS(ctypes.Structure):
+        _fields_ = [("cb", wintypes.DWORD), ("PageFaultCount", wintypes.DWORD)] + [
+            (name, ctypes.c_size_t) for name in (
+                "PeakWorkingSetSize", "WorkingSetSize", "QuotaPeakPagedPoolUsage", "QuotaPagedPoolUsage",
+                "QuotaPeakNonPagedPoolUsage", "QuotaNonPagedPoolUsage", "PagefileUsage", "PeakPagefileUsage")]
+
+    counters = PROCESS_MEMORY_COUNTERS()
+    counters.cb = ctypes.sizeof(counters)
+    try:
+        ok = ctypes.windll.psapi.GetProcessMemoryInfo(
+            ctypes.windll.kernel32.GetCurrentProcess(), ctypes.byref(counters), counters.cb)
+    except (AttributeError, OSError):
+        return None
+    return counters.PeakWorkingSetSize // 1024 if ok else None
+
+class SpanRecorder:
+    def __init__(self, sink=None):
+        self.sink = sink
+        self.spans = []
+        self._start = time.perf_counter()
+        self._lock = threading.Lock()
+
+    def add(self, entry: dict):
+        with self._lock:
+            self.spans.append(entry)
+        if self.sink:
+            self.sink(entry)
+
+    def elapsed_ms(self) -> float:
+        return (time.perf_counter() - self._start) * 1000
+
+@contextmanager
+def recording(sink=None):
+    """在 with 區塊內啟用 span 紀錄；sink(entry) 會在每筆 span 結束時被呼叫。"""
+    rec = SpanRecorder(sink)
+    token = _current.set(rec)
+    try:
+        yield rec
+    finally:
+        _current.reset(token)
+
+@contextmanager
+def span(name: str, **fields):
+    """計時 with 區塊；可在區塊內對回傳的 dict 補上 rows / bytes 等欄位。"""
+    rec = _current.get()
+    entry = {"span": name, **fields}
+    if rec is None:
+        yield entry
+        return
+    at = rec.elapsed_ms()
+    start = time.perf_counter()
+    try:
+        yield entry
+    except BaseException:
+        entry["failed"] = True
+        raise
+    finally:
+        entry["at_ms"] = round(at, 1)
+        entry["ms"] = round((time.perf_counter() - start) * 1000, 2)
+        entry["peak_rss_kib"] = peak_rss_kib()
+        rec.add(entry)
+
+def add_span(name: str, ms: float, **fields):
+    """記錄在別處量到的時間（例如 process pool 中繪製的圖）。"""
+    rec = _current.get()
+    if rec is None:
+        return
+    rec.add({"span": name, **fields, "at_ms": round(rec.elapsed_ms(), 1), "ms": round(ms, 2),
+             "peak_rss_kib": peak_rss_kib()})
+
+class JsonLinesSink:
+    """把 span 逐行附加到檔案；path 為 "-" 時寫到 stdout。"""
+
+    def __init__(self, path: str, **context):
+        self.path = path
+        self.context = context  # 例如 job id / 報表組名稱，附加在每一行
+        self._lock = threading.Lock()
+        if path != "-":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+
+    def __call__(self, entry: dict):
+        line = json.dumps({**self.context, **entry}, ensure_ascii=False, default=str) + "\n"
+        with self._lock:
+            if self.path == "-":
+                sys.stdout.write(line)
+                sys.stdout.flush()
+            else:
+                with open(self.path, "a", encoding="utf-8") as f:
+                    f.write(line)
+
+def _fmt_ms(ms: float) -> str:
+    return f"{ms / 1000:.2f}s" if ms >= 1000 else f"{ms:.0f}ms"
+
+def format_breakdown(spans: list) -> str:
+    """單行摘要：各階段時間（附筆數 / 大小），最後是最高常駐記憶體。"""
+    parts = []
+    for s in spans:
+        extra = []
+        if s.get("rows") is not None:
+            extra.append(f"{s['rows']:,} rows")
+        if s.get("bytes") is not None:
+            extra.append(f"{s['bytes'] / 1024:,.0f} KiB")
+        if s.get("cached"):
+            extra.append("cached")
+        parts.append(f"{s['span']} {_fmt_ms(s.get('ms', 0))}" + (f" ({', '.join(extra)})" if extra else ""))
+    peaks = [s["peak_rss_kib"] for s in spans if s.get("peak_rss_kib")]
+    if peaks:
+        parts.append(f"peak RSS {max(peaks) / 1024:,.0f} MiB")
+    return " | ".join(parts)
+
+@contextmanager
+def profiled(out_dir: str, label: str, threshold_s: float = 0.0, top: int = 30):
+    """以 cProfile + tracemalloc 執行 with 區塊；耗時 >= threshold_s 才寫出結果。
+
+    yield 的 dict 在結束後會帶有 "profile" / "tracemalloc" 兩個輸出檔路徑（若有寫出）。
+    """
+    info = {}
+    prof = cProfile.Profile()
+    started_tracing = not tracemalloc.is_tracing()
+    if started_tracing:
+        tracemalloc.start()
+    start = time.perf_counter()
+    prof.enable()
+    try:
+        yield info
+    finally:
+        prof.disable()
+        elapsed = time.perf_counter() - start
+        snapshot = tracemalloc.take_snapshot() if elapsed >= threshold_s else None
+        _, peak = tracemalloc.get_traced_memory()
+        if started_tracing:
+            tracemalloc.stop()
+
+        if snapshot is not None:
+            os.makedirs(out_dir, exist_ok=True)
+            base = os.path.join(out_dir, f"{label}_{datetime.now():%Y%m%d_%H%M%S}")
+            prof.dump_stats(base + ".prof")
+            with open(base + ".txt", "w", encoding="utf-8") as f:
+                f.write(f"# {label}: {elapsed:.2f}s, traced peak {peak / 2**20:.1f} MiB\n\n")
+                f.write(f"## Top {top} functions by cumulative time\n")
+                pstats.Stats(prof, stream=f).sort_stats("cumulative").print_stats(top)
+                f.write(f"\n## Top {top} allocation sites still held\n")
+                for stat in snapshot.statistics("lineno")[:top]:
+                    f.write(f"{stat}\n")
+            info.update(profile=base + ".prof", tracemalloc=base + ".txt", elapsed=round(elapsed, 3))
@@ -1,185 +1,256 @@
 # src/task.py
 import os
-import io
-import base64
-import subprocess
+import sys
+import numpy as np
 import pandas as pd
-import matplotlib.pyplot as plt
-import markdown
 from datetime import datetime
 import argparse
+from urllib.parse import quote
+
+if __package__ in (None, ""):
+    # 以 python src/task.py 直接執行時，讓 src.* 可被匯入
+    sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from src.ingest import read_table
+from src.aggregate import SalesTotals, top_with_other, update_totals
+from src.charts import CHART_FORMATS, FORMATS, ChartSpec, data_uri, file_ext, mime_type, render_charts
+from src.template import Raw, load_template
+from src.downsample import RESAMPLE_RULES
+from src.pdf import BACKENDS, DEFAULT_BACKEND, get_converter
+from src.spans import JsonLinesSink, profiled, recording, span
+from src.manifest import BuildManifest, cached_report
 
 # ---------------- 工具 ----------------
 
-def _fig_to_base64(fig) -> str:
-    buf = io.BytesIO()
-    # 固定邊界與 DPI，避免每張圖被不同程度裁切
-    fig.savefig(buf, format="png", bbox_inches=None, dpi=150, pad_inches=0.05)
-    plt.close(fig)
-    return base64.b64encode(buf.getvalue()).decode("ascii")
-
-def _daily_series(sales: pd.DataFrame, sales_info: pd.DataFrame) -> pd.DataFrame:
-    df = sales.merge(sales_info, on="product_code")
-    df["total"] = df["amount"] * df["price"]
-    df["sale_date"] = pd.to_datetime(df["sale_date"])
-    return df.groupby("sale_date", as_index=False)["total"].sum().sort_values("sale_date")
-
-def group_by_sales_id(sales, sales_info, top_n=None):
-    df = sales.merge(sales_info, on="product_code")
-    df["total"] = df["amount"] * df["price"]
-    out = df.groupby("sale_id", as_index=False)["total"].sum().sort_values("total", ascending=False)
-    return out.head(top_n) if top_n else out
-
-def group_by_product_name(sales, sales_info, top_n=None):
-    df = sales.merge(sales_info, on="product_code")
-    df["total"] = df["amount"] * df["price"]
-    out = df.groupby("product_name", as_index=False)["total"].sum().sort_values("total", ascending=False)
-    return out.head(top_n) if top_n else out
-
-def group_by_client_name(sales, sales_info, client, top_n=None):
-    df = sales.merge(sales_info[["product_code", "price"]], on="product_code", how="left")
-    df = df.merge(client[["client_id", "client_name"]], on="client_id", how="left")
-    df["total"] = df["amount"] * df["price"]
-    out = df.groupby("client_name", as_index=False)["total"].sum().sort_values("total", ascending=False)
-    return out.head(top_n) if top_n else out
-
-def pie_b64(df, label_col, title):
-    fig, ax = plt.subplots(figsize=(4.2, 4.2), constrained_layout=False)
-    wedges, texts, autotexts = ax.pie(
-        df["total"],
-        labels=df[label_col],
-        autopct="%.1f%%",
-        startangle=90,
-        labeldistance=1.05,   # 統一標籤距離
-        pctdistance=0.75,
-        radius=1.0
-        )
-    ax.set_aspect("equal")
-
-    # ax.set_title(title, pad=4)
-
-    # 圖例放下方，避免影響圓的可用空間
-    ax.legend(
-        wedges,
-        df[label_col],
-        loc="lower center",
-        bbox_to_anchor=(0.5, -0.08),
-        ncol=2,
-        frameon=False,
-        fontsize=8
-    )
-
-    # 固定子圖邊界，確保三張圖留白一致
-    fig.subplots_adjust(left=0.15, right=0.95, top=0.88, bottom=0.12)
-
-    return _fig_to_base64(fig)
-
-def line_daily_b64(sales: pd.DataFrame, sales_info: pd.DataFrame, max_xticks: int = 12) -> str:
-    plt.rcParams.update({
-        "axes.titlesize": 7,
-        "axes.labelsize": 7,
-        "xtick.labelsize": 6,
-        "ytick.labelsize": 6,
-    })
-
-    daily = _daily_series(sales, sales_info).sort_values("sale_date")
-    x = daily["sale_date"].dt.strftime("%Y-%m-%d")
-
-    fig, ax = plt.subplots(figsize=(5, 1.5))
-    ax.plot(daily["sale_date"], daily["total"], linewidth=1)
-
-    step = max(1, len(x) // max_xticks)
-    ax.set_xticks(daily["sale_date"][::step])
-    ax.set_xticklabels(x[::step], rotation=45, ha="right")
-
-    ax.set_xlabel("Sale Date", labelpad=3)
-    ax.set_ylabel("Total Sales")
-    # ax.set_title("Daily Sales Trend", pad=4)
-
-    fig.subplots_adjust(left=0.1, right=0.9, top=0.9, bottom=0.32)
-    return _fig_to_base64(fig)
-
-def render_template(md_template: str, mapping: dict) -> str:
-    """以 {{key}} 形式替換，避免與 CSS 的大括號衝突。"""
-    out = md_template
-    for k, v in mapping.items():
-        out = out.replace("{{" + k + "}}", str(v))
-    return out
+def _daily_series(totals: SalesTotals) -> pd.DataFrame:
+    return totals.daily.sort_index().rename_axis("sale_date").reset_index(name="total")
 
-# ---------------- 主流程 ----------------
+def _totals_by_name(by_key: pd.Series, table: pd.DataFrame, key: str, name_col: str) -> pd.DataFrame:
+    """把以代碼彙總的金額對照成名稱後再加總；對不到名稱的代碼不列入（與原本 merge 後 groupby 相同）。"""
+    ref = table.drop_duplicates(key)
+    pos = pd.Index(np.asarray(ref[key], dtype=object)).get_indexer(np.asarray(by_key.index, dtype=object))
+    names = np.asarray(ref[name_col], dtype=object)
+    df = pd.DataFrame({name_col: np.where(pos >= 0, names[pos], None), "total": by_key.to_numpy()})
+    return df.groupby(name_col, as_index=False)["total"].sum()
 
-if __name__ == "__main__":
-    # 路徑
-    BASE = os.path.dirname(os.path.abspath(__file__))             # .../projects/Report_Automation_System/src
-    ROOT = os.path.abspath(os.path.join(BASE, ".."))              # .../projects/Report_Automation_System
-
-    TEMPLATE_MD = os.path.join(ROOT, "templates/pdf_templates.md")          # 你的模板放 src/pdf_templates.md
-    
-    generated_on_filename = datetime.now().strftime("%Y-%m-%d")
-    OUTPUT_DIR = os.path.join(ROOT, "output")
-    os.makedirs(OUTPUT_DIR, exist_ok=True)
+# 三張圓餅圖共用 top_with_other：前 top_n 名之外合併成 "Other"
+def group_by_sales_id(totals: SalesTotals, top_n=None):
+    return top_with_other(totals.by_sale_id.rename_axis("sale_id").reset_index(name="total"), "sale_id", top_n)
 
-    OUT_HTML = os.path.join(OUTPUT_DIR, f"report_{generated_on_filename}.html")
-    OUT_PDF  = os.path.join(OUTPUT_DIR, f"report_{generated_on_filename}.pdf")
+def group_by_product_name(totals: SalesTotals, sales_info: pd.DataFrame, top_n=None):
+    return top_with_other(_totals_by_name(totals.by_product, sales_info, "product_code", "product_name"),
+                          "product_name", top_n)
 
-    # weasyprint.exe 路徑（放專案根目錄）
-    WEASY_EXE = os.path.join(ROOT, "weasyprint.exe")
-    if not os.path.isfile(WEASY_EXE):
-        raise FileNotFoundError(f"找不到 weasyprint.exe：{WEASY_EXE}")
+def group_by_client_name(totals: SalesTotals, client: pd.DataFrame, top_n=None):
+    return top_with_other(_totals_by_name(totals.by_client, client, "client_id", "client_name"),
+                          "client_name", top_n)
 
+# ---------------- 主流程 ----------------
+
+# 路徑
+BASE = os.path.dirname(os.path.abspath(__file__))             # .../projects/Report_Automation_System/src
+ROOT = os.path.abspath(os.path.join(BASE, ".."))              # .../projects/Report_Automation_System
+
+TEMPLATE_MD = os.path.join(ROOT, "templates/pdf_templates.md")          # 你的模板放 src/pdf_templates.md
+OUTPUT_DIR = os.path.join(ROOT, "output")
+
+IMAGE_MODES = ("inline", "files")
+
+def _image_refs(images: dict, mode: str, out_html: str) -> dict:
+    """把圖檔 {key: (bytes, 格式)} 轉成模板中 <img src> 的值。
+
+    inline：內嵌 data URI（單一 HTML 檔即可攜帶）。
+    files：寫成 HTML 旁的 <報表名>_assets/<名稱>.<副檔名>，以相對路徑引用，HTML 與轉檔都輕得多。
+    """
+    if mode == "inline":
+        return {k: Raw(data_uri(img, mime_type(fmt))) for k, (img, fmt) in images.items()}
+    if mode != "files":
+        raise ValueError(f"Unknown image mode: {mode!r} (expected one of {IMAGE_MODES})")
+
+    asset_dir = os.path.splitext(out_html)[0] + "_assets"
+    os.makedirs(asset_dir, exist_ok=True)
+    refs = {}
+    for k, (img, fmt) in images.items():
+        name = k + file_ext(fmt)
+        with open(os.path.join(asset_dir, name), "wb") as f:
+            f.write(img)
+        refs[k] = Raw(quote(f"{os.path.basename(asset_dir)}/{name}"))
+    return refs
+
+def report_tables(totals: SalesTotals, sales_info: pd.DataFrame, client: pd.DataFrame, top_n: int = 6) -> dict:
+    """圓餅圖與摘要用的三張排行表。"""
+    return {
+        "by_client": group_by_client_name(totals, client, top_n=top_n),
+        "by_prod": group_by_product_name(totals, sales_info, top_n=top_n),
+        "by_id": group_by_sales_id(totals, top_n=top_n),
+    }
+
+def chart_specs(tables: dict, totals: SalesTotals, formats: dict, trend: dict = None) -> dict:
+    """模板圖片欄位 -> ChartSpec。"""
+    return {
+        "img_client": ChartSpec("pie", tables["by_client"], {"label_col": "client_name", "title": "By Client", "fmt": formats["pie"]}),
+        "img_prod": ChartSpec("pie", tables["by_prod"], {"label_col": "product_name", "title": "By Product", "fmt": formats["pie"]}),
+        "img_id": ChartSpec("pie", tables["by_id"], {"label_col": "sale_id", "title": "By Sale ID", "fmt": formats["pie"]}),
+        "img_line": ChartSpec("line", _daily_series(totals), {"fmt": formats["line"], **(trend or {})}),
+    }
+
+def summary_fields(tables: dict) -> dict:
+    """模板中的文字欄位。"""
+    by_client, by_prod = tables["by_client"], tables["by_prod"]
+    return {
+        "total_rev": f"{by_client['total'].sum():,.0f}",
+        "top_client": by_client.iloc[0]["client_name"] if len(by_client) else "N/A",
+        "top_product": by_prod.iloc[0]["product_name"] if len(by_prod) else "N/A",
+        "generated_on": datetime.now().strftime("%Y-%m-%d %H:%M"),
+    }
+
+def report_path(output_prefix: str = "report") -> str:
+    """今天這份報表的 PDF 路徑：OUTPUT_DIR/<output_prefix>_<日期>.pdf。"""
+    return os.path.join(OUTPUT_DIR, f"{output_prefix}_{datetime.now():%Y-%m-%d}.pdf")
+
+def build_report(totals: SalesTotals, sales_info: pd.DataFrame, client: pd.DataFrame,
+                 images: str = "inline", chart_formats: dict = None, trend: dict = None,
+                 template: str = None, output_prefix: str = "report", pdf_backend: str = None) -> str:
+    """產生一份報表，回傳 PDF 路徑。可由 CLI 或常駐 worker 重複呼叫。
+
+    images 為 "inline"（base64 內嵌）或 "files"（圖檔放在 HTML 旁，以相對路徑引用）。
+    chart_formats 依圖種覆寫輸出格式，例如 {"line": "svg-simplified"}；未指定者沿用 CHART_FORMATS。
+    trend 傳給趨勢圖的 downsample / resample 參數，例如 {"resample": "monthly"}。
+    template 為 Markdown 模板路徑（預設 TEMPLATE_MD）；輸出檔名為 <output_prefix>_<日期>.html / .pdf。
+    pdf_backend 為 src.pdf 的轉檔後端名稱，None 時依 RAS_PDF_BACKEND（預設 auto）。
+    """
+    name = os.path.splitext(os.path.basename(report_path(output_prefix)))[0]
+    return build_reports([(totals, name)], sales_info, client, images=images, chart_formats=chart_formats,
+                         trend=trend, template=template, pdf_backend=pdf_backend)[0]
+
+def build_reports(reports, sales_info: pd.DataFrame, client: pd.DataFrame,
+                  images: str = "inline", chart_formats: dict = None, trend: dict = None,
+                  template: str = None, pdf_backend: str = None) -> list:
+    """一次產生多份報表：reports 為 [(totals, 輸出檔名（不含副檔名）), ...]，回傳 PDF 路徑清單。
+
+    所有報表的圖一起交給 render_charts（在 process pool 中平行繪製），PDF 以 convert_many 批次轉換；
+    其餘參數與 build_report 相同。
+    """
+    reports = list(reports)
+    formats = {**CHART_FORMATS, **(chart_formats or {})}
+    converter = get_converter(pdf_backend)  # 先取得轉檔器，找不到時在作圖前就失敗
+    os.makedirs(OUTPUT_DIR, exist_ok=True)
+
+    # 聚合與作圖（totals 由 update_totals 增量維護）
+    with span("tables", reports=len(reports)):
+        tables = [report_tables(totals, sales_info, client) for totals, _ in reports]
+        specs = [chart_specs(t, totals, formats, trend) for t, (totals, _) in zip(tables, reports)]
+    charts = iter(render_charts([spec for sp in specs for spec in sp.values()],
+                                names=[key for sp in specs for key in sp]))
+
+    # 模板已預先編譯成 HTML 片段（保留你在 md 裡的 <style> 與 HTML），圖片只在寫檔時串流寫入
+    with span("markdown"):
+        tpl = load_template(template or TEMPLATE_MD)
+
+    pairs = []
+    with span("html", reports=len(reports)) as s:
+        for (_, name), t, sp in zip(reports, tables, specs):
+            out_html = os.path.join(OUTPUT_DIR, f"{name}.html")
+            imgs = _image_refs({k: (next(charts), spec.params["fmt"]) for k, spec in sp.items()}, images, out_html)
+            tpl.write({**imgs, **summary_fields(t)}, out_html)
+            pairs.append((out_html, os.path.join(OUTPUT_DIR, f"{name}.pdf")))
+        s["bytes"] = sum(os.path.getsize(html) for html, _ in pairs)
+
+    # HTML -> PDF（後端見 src/pdf.py；預設為 weasyprint.exe）
+    with span("pdf", backend=converter.name, reports=len(reports)) as s:
+        pdfs = converter.convert_many(pairs)
+        s["bytes"] = sum(os.path.getsize(pdf) for pdf in pdfs)
+
+    return pdfs
+
+# trend 未指定的欄位沿用 line_daily_chart 的預設值
+TREND_DEFAULTS = {"resample": None, "downsample": "minmax"}
+
+def build_cached(inputs: dict, build, output_prefix: str = "report", template: str = None,
+                 force: bool = False, images: str = "inline", chart_formats: dict = None,
+                 trend: dict = None, pdf_backend: str = None):
+    """輸入檔、模板、程式與選項都與上次相同時沿用上次的 PDF，否則呼叫 build()；回傳 (PDF 路徑, 是否沿用)。
+
+    inputs 為 {"sales": ..., "sales_info": ..., "client": ...}；images、chart_formats、trend、
+    pdf_backend 為會影響輸出的參數，與 build_report 相同。force（--full）一律重新產生。見 src/manifest.py。
+    選項先補上預設值再比對，CLI（明確的預設值）與 GUI worker（None）產生同一份報表時指紋相同。
+    """
+    options = {
+        "images": images or "inline",
+        "chart_formats": {**CHART_FORMATS, **(chart_formats or {})},
+        "trend": {**TREND_DEFAULTS, **(trend or {})},
+        "pdf_backend": pdf_backend or DEFAULT_BACKEND,
+    }
+    return cached_report(BuildManifest(OUTPUT_DIR), output_prefix, inputs, template or TEMPLATE_MD, options,
+                         report_path(output_prefix), build, force=force)
+
+def main(argv=None):
     # 存取參數
     parser = argparse.ArgumentParser()
-    parser.add_argument("--sales", required=True, help="Path to sales.csv")
-    parser.add_argument("--sales-info", required=True, help="Path to sales_info.csv")
-    parser.add_argument("--client", required=True, help="Path to client.csv")
-    args = parser.parse_args()
-
-    sales = pd.read_csv(args.sales)
-    sales_info = pd.read_csv(args.sales_info)
-    client = pd.read_csv(args.client)
-
-    # 聚合與作圖
-    by_client = group_by_client_name(sales, sales_info, client, top_n=6)
-    by_prod   = group_by_product_name(sales, sales_info, top_n=6)
-    by_id     = group_by_sales_id(sales, sales_info, top_n=6)
-
-    img_client = pie_b64(by_client, "client_name", "By Client")
-    img_prod   = pie_b64(by_prod, "product_name", "By Product")
-    img_id     = pie_b64(by_id, "sale_id", "By Sale ID")
-    img_line   = line_daily_b64(sales, sales_info)
-
-    total_rev   = f"{by_client['total'].sum():,.0f}"
-    top_client  = by_client.iloc[0]["client_name"] if len(by_client) else "N/A"
-    top_product = by_prod.iloc[0]["product_name"] if len(by_prod) else "N/A"
-
-    # 讀模板並代入
-    with open(TEMPLATE_MD, "r", encoding="utf-8") as f:
-        md_tpl = f.read()
-
-    generated_on = datetime.now().strftime("%Y-%m-%d %H:%M")
-
-    md_text = render_template(md_tpl, {
-        "img_client": img_client,
-        "img_prod": img_prod,
-        "img_id": img_id,
-        "img_line": img_line,
-        "total_rev": total_rev,
-        "top_client": top_client,
-        "top_product": top_product,
-        "generated_on": generated_on,
-    })
-
-    # Markdown -> HTML（保留你在 md 裡的 <style> 與 HTML）
-    html_body = markdown.markdown(
-        md_text,
-        extensions=["extra", "tables", "sane_lists", "toc", "attr_list"]
-    )
-    html_full = "<!doctype html><html><meta charset='utf-8'><body>" + html_body + "</body></html>"
-
-    with open(OUT_HTML, "w", encoding="utf-8") as f:
-        f.write(html_full)
-
-    # HTML -> PDF（呼叫獨立可執行檔，不需任何系統 DLL）
-    subprocess.run([WEASY_EXE, OUT_HTML, OUT_PDF], check=True)
-
-    print("OK ->", OUT_PDF)
+    parser.add_argument("--sales", required=True, help="Path to sales.csv (or workbook.xlsx#sheet)")
+    parser.add_argument("--sales-info", required=True, help="Path to sales_info.csv (or workbook.xlsx#sheet)")
+    parser.add_argument("--client", required=True, help="Path to client.csv (or workbook.xlsx#sheet)")
+    parser.add_argument("--template", help="Markdown template (default: templates/pdf_templates.md)")
+    parser.add_argument("--output-prefix", default="report", help="Output file name prefix")
+    parser.add_argument("--pdf-backend", choices=BACKENDS, help="HTML to PDF converter (default: RAS_PDF_BACKEND or auto)")
+    parser.add_argument("--spans", metavar="PATH",
+                        help="Write per-stage timings as JSON lines to PATH ('-' for stdout)")
+    parser.add_argument("--profile-slow", type=float, metavar="SECONDS",
+                        help="Profile the run (cProfile + tracemalloc) and keep the output if it takes at least SECONDS")
+    parser.add_argument("--full", action="store_true",
+                        help="Ignore stored aggregates and the report cache; rebuild from the first row "
+                             "(needed after editing rows in the middle of the sales file)")
+    parser.add_argument("--images", choices=IMAGE_MODES, default="inline",
+                        help="Embed charts as base64 (inline) or write them next to the HTML (files)")
+    parser.add_argument("--chart-format", action="append", default=[], metavar="KIND=FORMAT",
+                        help=f"Output format per chart kind, e.g. line=svg-simplified; formats: {', '.join(FORMATS)}")
+    parser.add_argument("--trend-resample", choices=RESAMPLE_RULES,
+                        help="Sum the daily trend into weekly or monthly points")
+    parser.add_argument("--trend-downsample", choices=["minmax", "lttb", "none"], default="minmax",
+                        help="Downsampling used when the trend has more points than the chart has pixels")
+    args = parser.parse_args(argv)
+
+    trend = {
+        "resample": args.trend_resample,
+        "downsample": None if args.trend_downsample == "none" else args.trend_downsample,
+    }
+
+    chart_formats = {}
+    for item in args.chart_format:
+        kind, _, fmt = item.partition("=")
+        if kind not in CHART_FORMATS or fmt not in FORMATS:
+            parser.error(f"invalid --chart-format {item!r}")
+        chart_formats[kind] = fmt
+
+    def build():
+        with span("load.sales_info") as s:
+            sales_info = read_table(args.sales_info, "sales_info")
+            s["rows"] = len(sales_info)
+        with span("load.client") as s:
+            client = read_table(args.client, "client")
+            s["rows"] = len(client)
+        totals = update_totals(args.sales, sales_info, rebuild=args.full)
+
+        return build_report(totals, sales_info, client, images=args.images,
+                            chart_formats=chart_formats, trend=trend,
+                            template=args.template, output_prefix=args.output_prefix,
+                            pdf_backend=args.pdf_backend)
+
+    def run():
+        return build_cached({"sales": args.sales, "sales_info": args.sales_info, "client": args.client}, build,
+                            output_prefix=args.output_prefix, template=args.template, force=args.full,
+                            images=args.images, chart_formats=chart_formats, trend=trend,
+                            pdf_backend=args.pdf_backend)
+
+    with recording(JsonLinesSink(args.spans) if args.spans else None):
+        if args.profile_slow is None:
+            out_pdf, cached = run()
+        else:
+            with profiled(os.path.join(OUTPUT_DIR, "profiles"), args.output_prefix, args.profile_slow) as prof:
+                out_pdf, cached = run()
+            if prof:
+                print("Profile ->", prof["profile"], prof["tracemalloc"])
+    print("OK (cached, inputs unchanged) ->" if cached else "OK ->", out_pdf)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+# src/template.py
+"""報表模板：編譯一次，串流輸出。
+
+模板中的 {{key}} 先換成不會被 Markdown 改動的佔位字串，整份模板只做一次
+markdown -> HTML，再依佔位字串切成「固定片段 / 變數」的清單。輸出時逐段寫入檔案，
+base64 圖片等大型內容只在最後寫檔時才出現，不再反覆複製整份文件，也不必經過 Markdown。
+"""
+import os
+import re
+import html
+import markdown
+
+MD_EXTENSIONS = ["extra", "tables", "sane_lists", "toc", "attr_list"]
+
+HTML_HEAD = "<!doctype html><html><meta charset='utf-8'><body>"
+HTML_TAIL = "</body></html>"
+
+_PLACEHOLDER = re.compile(r"\{\{(\w+)\}\}")
+_SLOT = re.compile(r"rasslot(\d+)end")
+
+class Raw(str):
+    """不需跳脫、原樣寫入的值（例如 base64 圖片資料）。"""
+
+class CompiledTemplate:
+    def __init__(self, parts):
+        # parts: 依序排列的 ("text", 字串) 或 ("slot", key)
+        self.parts = parts
+
+    @property
+    def keys(self):
+        return [v for kind, v in self.parts if kind == "slot"]
+
+    def _chunks(self, mapping: dict):
+        for kind, value in self.parts:
+            if kind == "text":
+                yield value
+            elif value in mapping:
+                v = mapping[value]
+                # 原本變數會經過 Markdown，一般文字在這裡做等效的 HTML 跳脫
+                yield v if isinstance(v, Raw) else html.escape(str(v), quote=False)
+            else:
+                yield "{{" + value + "}}"  # 未提供的變數保留原樣
+
+    def render(self, mapping: dict) -> str:
+        return "".join(self._chunks(mapping))
+
+    def write(self, mapping: dict, path: str):
+        """逐段寫入檔案，不在記憶體中組出完整 HTML。"""
+        with open(path, "w", encoding="utf-8") as f:
+            for chunk in self._chunks(mapping):
+                f.write(chunk)
+
+def compile_template(md_template: str) -> CompiledTemplate:
+    keys = []
+
+    def slot(m):
+        keys.append(m.group(1))
+        return f"rasslot{len(keys) - 1}end"
+
+    body = markdown.markdown(_PLACEHOLDER.sub(slot, md_template), extensions=MD_EXTENSIONS)
+
+    parts = []
+    pos = 0
+    for m in _SLOT.finditer(body):
+        parts.append(("text", body[pos:m.start()]))
+        parts.append(("slot", keys[int(m.group(1))]))
+        pos = m.end()
+    parts.append(("text", body[pos:]))
+
+    parts[0] = ("text", HTML_HEAD + parts[0][1])
+    parts[-1] = ("text", parts[-1][1] + HTML_TAIL)
+    return CompiledTemplate([p for p in parts if p != ("text", "")])
+
+# path -> (mtime_ns, CompiledTemplate)
+_compiled = {}
+
+def load_template(path: str) -> CompiledTemplate:
+    """讀取並編譯模板檔；檔案未變動時沿用上次的編譯結果。"""
+    mtime = os.stat(path).st_mtime_ns
+    hit = _compiled.get(path)
+    if hit and hit[0] == mtime:
+        return hit[1]
+    with open(path, "r", encoding="utf-8") as f:
+        tpl = compile_template(f.read())
+    _compiled[path] = (mtime, tpl)
+    return tpl
@@ -0,0 +1,97 @@
+# src/watcher.py
+"""監控檔案的事件式監看（watchfiles），不依賴 Qt，GUI 與無視窗模式共用。
+
+監看執行在背景 thread：
+1. watchfiles 把短時間內連續的寫入合併成一批（debounce）。
+2. 對這批有變動的檔案，持續比對大小與 mtime，直到整整 settle 秒都沒有再變，
+   避免讀到寫到一半的 CSV。
+3. 呼叫 on_change(變動的檔案清單)。callback 在背景 thread 執行，GUI 端需自行轉回主執行緒。
+"""
+import os
+import threading
+
+from watchfiles import watch
+
+def _norm(path: str) -> str:
+    return os.path.normcase(os.path.abspath(path))
+
+def _snapshot(paths):
+    snap = {}
+    for p in paths:
+        try:
+            st = os.stat(p)
+            snap[p] = (st.st_size, st.st_mtime_ns)
+        except OSError:
+            snap[p] = None  # 暫時不存在（例如以「寫暫存檔再改名」方式更新）
+    return snap
+
+class FileWatcher:
+    def __init__(self, paths, on_change, debounce_ms: int = 1000, settle_s: float = 2.0):
+        self.on_change = on_change
+        self.debounce_ms = debounce_ms
+        self.settle_s = settle_s
+        self._paths = {_norm(p): p for p in paths}
+        self._stop = threading.Event()
+        self._thread = None
+        self._handled = {}  # path -> 已觸發過的 (size, mtime)，等待期間累積的重複事件不再觸發
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        if self.running or not self._paths:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="FileWatcher", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 5.0):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def update_paths(self, paths):
+        """更換監看清單；執行中則重新啟動監看。清單沒變時不做任何事（stop 最多會等 5 秒）。"""
+        new = {_norm(p): p for p in paths}
+        if new == self._paths:
+            return
+        was_running = self.running
+        self.stop()
+        self._paths = new
+        if was_running:
+            self.start()
+
+    def _run(self):
+        # 監看檔案所在的資料夾：編輯器常以改名取代原檔，直接監看檔案會漏掉
+        dirs = sorted({os.path.dirname(p) for p in self._paths if os.path.isdir(os.path.dirname(p))})
+        if not dirs:
+            return
+
+        for changes in watch(
+            *dirs,
+            watch_filter=lambda _change, path: _norm(path) in self._paths,
+            debounce=self.debounce_ms,
+            stop_event=self._stop,
+            recursive=False,
+        ):
+            changed = sorted({self._paths[_norm(p)] for _, p in changes})
+            if not self._wait_until_stable(changed):
+                continue
+            snap = _snapshot(changed)
+            # 被刪除的檔案、或內容已經處理過的檔案不觸發
+            fresh = [p for p in changed if snap[p] is not None and self._handled.get(p) != snap[p]]
+            if fresh:
+                self._handled.update((p, snap[p]) for p in fresh)
+                self.on_change(fresh)
+
+    def _wait_until_stable(self, paths) -> bool:
+        """等到檔案連續 settle_s 秒沒有變化；中途被要求停止則回傳 False。"""
+        before = _snapshot(paths)
+        while not self._stop.wait(self.settle_s):
+            after = _snapshot(paths)
+            if after == before:
+                return True
+            before = after
+        return False
@@ -0,0 +1,131 @@
+# src/worker.py
+"""常駐報表 worker。
+
+GUI 只啟動一次（python -m src.worker），之後以 stdin 逐行送入 JSON 工作：
+    {"id": 1, "sales": "...", "sales_info": "...", "client": "...", "images": "inline",
+     "template": null, "output_prefix": "report"}
+每個工作完成後在 stdout 回傳一行 JSON：
+    {"id": 1, "status": "ok", "output": "...pdf", "cached": false, "elapsed": 1.23, "spans": [...]}
+cached 為 true 表示輸入與上次相同，沿用了上次的 PDF（見 src/manifest.py；"full" 的工作一律重新產生）。
+spans 為各階段的計時（見 src/spans.py）；工作帶有 span_log 時也逐行附加到該檔案，
+帶有 profile_slow_s 時以 cProfile + tracemalloc 執行，超過該秒數才寫出剖析結果。
+pandas / matplotlib / markdown 與字型快取只在啟動時載入一次，參考表也會保留在記憶體中；
+多個報表組共用同一份 sales_info / client 時只會載入一次。
+--chart-workers 限制每個 worker 的繪圖 process 數，多個 worker 並行時由 GUI 平分 CPU。
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import traceback
+
+import matplotlib
+matplotlib.use("Agg")  # 無視窗後端，避免 worker 需要顯示環境
+import matplotlib.pyplot as plt
+import pandas as pd
+
+from src import charts
+from src.ingest import read_table, source_file
+from src.aggregate import update_totals
+from src.task import OUTPUT_DIR, TEMPLATE_MD, build_cached, build_report
+from src.template import load_template
+from src.spans import JsonLinesSink, profiled, recording, span
+from src.pdf import close_converters
+
+# (path, kind) -> (mtime, size, DataFrame)
+_table_cache = {}
+
+def _read_cached(path: str, kind: str) -> pd.DataFrame:
+    """檔案未變（mtime、大小相同）就直接回傳記憶體中的表，否則經由欄式快取載入。"""
+    st = os.stat(source_file(path))
+    hit = _table_cache.get((path, kind))
+    if hit and hit[0] == st.st_mtime_ns and hit[1] == st.st_size:
+        return hit[2]
+    df = read_table(path, kind)
+    _table_cache[(path, kind)] = (st.st_mtime_ns, st.st_size, df)
+    return df
+
+def _warm_up():
+    # 先畫一張空圖，讓字型快取在第一個工作之前就初始化完成
+    fig, ax = plt.subplots(figsize=(1, 1))
+    ax.plot([0, 1], [0, 1])
+    fig.canvas.draw()
+    plt.close(fig)
+    # 預設模板也先編譯（markdown 擴充套件的載入約需數百毫秒）
+    load_template(TEMPLATE_MD)
+
+def _emit(msg: dict):
+    sys.stdout.write(json.dumps(msg, ensure_ascii=False) + "\n")
+    sys.stdout.flush()
+
+def _load_ref(name: str, path: str) -> pd.DataFrame:
+    with span(f"load.{name}") as s:
+        df = _read_cached(path, name)
+        s["rows"] = len(df)
+    return df
+
+def _build(job: dict):
+    """回傳 (PDF 路徑, 是否沿用上次的 PDF)。"""
+    options = {"images": job.get("images", "inline"), "chart_formats": job.get("chart_formats"),
+               "trend": job.get("trend"), "pdf_backend": job.get("pdf_backend")}
+
+    def build():
+        # sales_info / client 為參考表，保留在記憶體；sales 只解析新增的列
+        sales_info = _load_ref("sales_info", job["sales_info"])
+        client = _load_ref("client", job["client"])
+        totals = update_totals(job["sales"], sales_info, rebuild=job.get("full", False))
+        return build_report(totals, sales_info, client, template=job.get("template"),
+                            output_prefix=job.get("output_prefix", "report"), **options)
+
+    inputs = {k: job[k] for k in ("sales", "sales_info", "client")}
+    return build_cached(inputs, build, output_prefix=job.get("output_prefix", "report"),
+                        template=job.get("template"), force=job.get("full", False), **options)
+
+def run_job(job: dict) -> dict:
+    start = time.perf_counter()
+    sink = JsonLinesSink(job["span_log"], job=job.get("id"), output_prefix=job.get("output_prefix", "report")) \
+        if job.get("span_log") else None
+    reply = {"id": job.get("id")}
+    with recording(sink) as rec:
+        try:
+            if job.get("profile_slow_s") is None:
+                out_pdf, cached = _build(job)
+            else:
+                with profiled(os.path.join(OUTPUT_DIR, "profiles"), job.get("output_prefix", "report"),
+                              float(job["profile_slow_s"])) as prof:
+                    out_pdf, cached = _build(job)
+                if prof:
+                    reply["profile"] = prof
+            reply.update(status="ok", output=out_pdf, cached=cached)
+        except Exception as e:
+            traceback.print_exc(file=sys.stderr)
+            reply.update(status="error", error=f"{type(e).__name__}: {e}")
+    reply.update(elapsed=round(time.perf_counter() - start, 3), spans=rec.spans)
+    return reply
+
+def main(argv=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--chart-workers", type=int, help="Processes used to render charts (default: CHART_WORKERS)")
+    args = parser.parse_args(argv)
+    if args.chart_workers:
+        charts.CHART_WORKERS = args.chart_workers
+
+    _warm_up()
+    _emit({"event": "ready", "pid": os.getpid()})
+
+    for line in sys.stdin:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            job = json.loads(line)
+        except json.JSONDecodeError as e:
+            _emit({"status": "error", "error": f"Bad job: {e}"})
+            continue
+        _emit(run_job(job))
+
+    close_converters()  # 結束常駐的轉檔服務（若有）
+
+if __name__ == "__main__":
+    main()